@@ -0,0 +1,95 @@
+"""Benchmark the sampling of the active users of each date (the loop over
+the dates in get_session_dataset) with each sampler and engine, for a
+synthetic user pool of 100k, 1M and 10M users.
+
+Usage:
+    python -m benchmarks.bench_session_sampling [--n-days 7] [--users 100000 ...]
+
+The 'numba' engine is skipped if numba is not installed.  Its first call
+in the process (compiling the kernel, or loading it from the on-disk cache)
+is timed separately, as the cold call.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src._kernels import get_sample_user_positions_kernel
+from src.data import (_get_date_streams, _get_stickiness_decay_weights,
+                      _sample_user_positions)
+
+
+# (sampler, engine) pairs to time
+BACKENDS = [('choice', 'numpy'), ('exponential', 'numpy'),
+            ('exponential', 'numba')]
+
+
+def get_user_pool(n_users, *, n_days, active_p=0.25, seed=0):
+    """Return the pool arrays of n_users users, activated uniformly over
+    the year before the n_days dates, with DAU of active_p of the pool."""
+    rng = np.random.default_rng(seed)
+    activation_days = np.sort(rng.integers(0, 365 + n_days, size=n_users))
+    date_days = np.arange(365, 365 + n_days)
+    pool_sizes = np.searchsorted(activation_days, date_days, side='right')
+    new_users = pool_sizes - np.searchsorted(activation_days, date_days)
+    session_counts = np.maximum((active_p * pool_sizes).astype(np.int64),
+                                new_users)
+    return {'activation_days': activation_days,
+            'score_weights': 0.2 * rng.poisson(100, size=n_users),
+            'decay_weights': _get_stickiness_decay_weights(365 + n_days),
+            'date_days': date_days,
+            'session_counts': session_counts}
+
+
+def time_backend(pool, *, sampler, engine, n_days):
+    """Return seconds of the sampling of the n_days dates, and of the cold
+    call of the numba engine (one date, None for numpy)."""
+    date_seeds, bit_generator = _get_date_streams(n_days, seed=0)
+    cold_seconds = None
+    if engine == 'numba' and not _kernel_loaded:
+        start = time.perf_counter()
+        _sample_user_positions(**dict(pool, date_days=pool['date_days'][:1],
+                                      session_counts=pool['session_counts'][:1]),
+                               date_seeds=date_seeds[:1], engine=engine)
+        cold_seconds = time.perf_counter() - start
+        _kernel_loaded.append(True)
+    start = time.perf_counter()
+    _sample_user_positions(**pool, date_seeds=date_seeds,
+                           bit_generator=bit_generator, sampler=sampler,
+                           engine=engine)
+    return time.perf_counter() - start, cold_seconds
+
+
+# whether the numba kernel has been called in this process
+_kernel_loaded = []
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n-days', type=int, default=7)
+    parser.add_argument('--users', type=int, nargs='+',
+                        default=[100_000, 1_000_000, 10_000_000])
+    args = parser.parse_args(args)
+
+    backends = [(sampler, engine) for sampler, engine in BACKENDS
+                if engine != 'numba'
+                or get_sample_user_positions_kernel() is not None]
+    print('{:>10}  {:>20}  {:>10}  {:>8}  {:>12}'.format(
+        'users', 'sampler/engine', 's/day', 'speedup', 'cold call s'))
+    for n_users in args.users:
+        pool = get_user_pool(n_users, n_days=args.n_days)
+        baseline = None
+        for sampler, engine in backends:
+            seconds, cold_seconds = time_backend(pool, sampler=sampler,
+                                                 engine=engine,
+                                                 n_days=args.n_days)
+            seconds /= args.n_days
+            baseline = baseline or seconds
+            print('{:>10,}  {:>20}  {:>10.4f}  {:>7.1f}x  {:>12}'.format(
+                n_users, '{}/{}'.format(sampler, engine), seconds,
+                baseline / seconds,
+                '' if cold_seconds is None else '{:.2f}'.format(cold_seconds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import functools
+import inspect
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+                                     'n_items', 'size_bytes', 'max_bytes'])
+
+_cache = None
+
+
+class _LRUCache:
+    """Least-recently-used cache of values, bounded by their total size in
+    bytes (the least recently used values are evicted first)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, value) if key is cached, else (False, None)."""
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return True, self._items[key][0]
+
+    def put(self, key, value, n_bytes):
+        with self._lock:
+            if n_bytes > self.max_bytes:
+                return
+            if key in self._items:
+                self.size_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, n_bytes)
+            self.size_bytes += n_bytes
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self.size_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             len(self._items), self.size_bytes,
+                             self.max_bytes)
+
+
+def enable_cache(max_bytes=512 * 2 ** 20):
+    """Turn on the in-process cache of seeded trajectories and datasets
+    (replacing any existing cache).
+
+    Args:
+        max_bytes (int, optional): size limit of the cached values in
+            bytes, least recently used values are evicted beyond it.
+            Defaults to 512 MiB.
+    """
+    global _cache
+    _cache = _LRUCache(max_bytes)
+
+
+def disable_cache():
+    """Turn off (and empty) the in-process cache."""
+    global _cache
+    _cache = None
+
+
+def cache_info():
+    """Return CacheInfo of the hits, misses, evictions, number of items and
+    size of the cache (None if the cache is off)."""
+    if _cache is None:
+        return None
+    return _cache.info()
+
+
+def memoize(func):
+    """Decorator to cache the results of func in the in-process cache, if
+    the cache is on (see enable_cache).
+
+    Only seeded calls are cached (seed given, no rng), as unseeded calls
+    should give new draws.  Cached pandas objects are returned as copies
+    and arrays as read-only views, so callers can't corrupt the cache.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _cache
+        if cache is None:
+            return func(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        arguments = arguments.arguments
+        if arguments.get('seed') is None or arguments.get('rng') is not None:
+            return func(*args, **kwargs)
+
+        try:
+            key = (func.__module__, func.__qualname__, _freeze(arguments))
+            hash(key)
+        except TypeError:  # e.g. array arguments
+            return func(*args, **kwargs)
+
+        is_cached, value = cache.get(key)
+        if not is_cached:
+            value = _protect(func(*args, **kwargs))
+            cache.put(key, value, _get_n_bytes(value))
+        return _share(value)
+
+    return wrapper
+
+
+def _freeze(value):
+    """Return hashable version of argument values (dicts, lists)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _protect(value):
+    """Return the value to store in the cache."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+    return value
+
+
+def _share(value):
+    """Return a cached value to a caller."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, np.ndarray):
+        return value.view()
+    return value
+
+
+def _get_n_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
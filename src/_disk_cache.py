@@ -0,0 +1,381 @@
+"""Persistent on-disk cache of seeded datasets.
+
+A seeded dataset is fully determined by its parameters, so it is stored
+under a directory named by a hash of the function, its parameters and the
+library and cache versions.  Each column is stored as a .npy file.  Loads
+return writable copies, or with enable_disk_cache(mmap=True), read-only
+memory maps (mmap_mode='r'), so warm loads are cheap and processes share
+the page cache.
+
+Usage from the command line:
+    python -m src._disk_cache info|verify|clean [--cache-dir DIR] [--max-bytes N]
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from src import __version__
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'),
+                                                  '.cache')),
+    'saas-business-simulation')
+
+DiskCacheEntry = namedtuple('DiskCacheEntry', ['key', 'function', 'version',
+                                               'size_bytes', 'last_used'])
+
+# version of the cached datasets (their columns, dtypes and draws) and of
+# the file format: bump it when they change, so that entries written by
+# older code are not reloaded
+CACHE_VERSION = 2
+_VERSION = '{}+cache{}'.format(__version__, CACHE_VERSION)
+
+_META_FILE = 'meta.json'
+_disk_cache = None
+
+
+class _DiskCache:
+    def __init__(self, cache_dir, max_bytes=None, mmap=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, key):
+        """Return the cached DataFrame for key, or None if not cached."""
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry_dir, _META_FILE)) as f:
+                meta = json.load(f)
+            df = _read_frame(entry_dir, meta, mmap=self.mmap)
+        except (OSError, ValueError, KeyError):
+            return None
+        # mark as recently used (for the LRU clean up)
+        os.utime(os.path.join(entry_dir, _META_FILE))
+        return df
+
+    def store(self, key, df, *, function):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry_dir):
+            return
+        # write to a temp dir, then rename, so readers never see partial
+        # entries (and concurrent writers of the same key are harmless)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            meta = _write_frame(tmp_dir, df)
+            meta.update({'function': function, 'version': _VERSION})
+            with open(os.path.join(tmp_dir, _META_FILE), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        if self.max_bytes is not None:
+            with self._lock:
+                clean_disk_cache(self.max_bytes, cache_dir=self.cache_dir)
+
+
+def enable_disk_cache(cache_dir=None, *, max_bytes=None, mmap=False):
+    """Turn on the on-disk cache of seeded user and session datasets.
+
+    Args:
+        cache_dir (str, optional): cache directory.  Defaults to None
+            (DEFAULT_CACHE_DIR).
+        max_bytes (int, optional): size limit of the cache directory in
+            bytes, least recently used datasets are removed beyond it.
+            Defaults to None (no limit).
+        mmap (bool, optional): return cached datasets backed by read-only
+            memory maps of the cache files, which load faster and share
+            memory between processes, but can't be modified in place (copy
+            them first).  Defaults to False (writable copies).
+    """
+    global _disk_cache
+    _disk_cache = _DiskCache(cache_dir or DEFAULT_CACHE_DIR,
+                             max_bytes=max_bytes, mmap=mmap)
+
+
+def disable_disk_cache():
+    """Turn off the on-disk cache (the files are kept)."""
+    global _disk_cache
+    _disk_cache = None
+
+
+def disk_cached(func=None, *, ignore=(), bypass=()):
+    """Decorator to cache the DataFrames returned by func on disk, if the
+    disk cache is on (see enable_disk_cache).
+
+    Only seeded calls are cached (seed given, no rng).  Arguments in ignore
+    (e.g. n_jobs) don't change the result so are not part of the key.
+    Calls with any argument in bypass given (not None) are not cached, e.g.
+    for results with attrs or dtypes the cache can't reproduce.
+    """
+    if func is None:
+        return functools.partial(disk_cached, ignore=ignore, bypass=bypass)
+    signature = inspect.signature(func)
+    function = '{}.{}'.format(func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _disk_cache
+        if cache is None:
+            return func(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        if any(arguments.arguments.get(name) is not None for name in bypass):
+            return func(*args, **kwargs)
+        arguments = {k: v for k, v in arguments.arguments.items()
+                     if k not in ignore}
+        if arguments.get('seed') is None or arguments.get('rng') is not None:
+            return func(*args, **kwargs)
+
+        try:
+            key = _get_key(function, arguments)
+        except TypeError:  # arguments that can't be hashed
+            return func(*args, **kwargs)
+
+        df = cache.load(key)
+        if df is None:
+            df = func(*args, **kwargs)
+            cache.store(key, df, function=function)
+        return df
+
+    return wrapper
+
+
+def list_disk_cache(cache_dir=None):
+    """Return list of DiskCacheEntry in the cache directory, least recently
+    used first."""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        if key.startswith('.') or not os.path.isdir(entry_dir):
+            continue
+        meta_path = os.path.join(entry_dir, _META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            last_used = os.path.getmtime(meta_path)
+        except (OSError, ValueError):
+            meta, last_used = {}, 0
+        size_bytes = sum(os.path.getsize(os.path.join(entry_dir, name))
+                         for name in os.listdir(entry_dir))
+        entries.append(DiskCacheEntry(key, meta.get('function'),
+                                      meta.get('version'), size_bytes,
+                                      last_used))
+    return sorted(entries, key=lambda entry: entry.last_used)
+
+
+def clean_disk_cache(max_bytes=0, *, cache_dir=None):
+    """Remove least recently used datasets (and any from other library
+    versions) until the cache directory is within max_bytes.
+
+    Returns:
+        list of the removed DiskCacheEntry
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    entries = list_disk_cache(cache_dir)
+    size_bytes = sum(entry.size_bytes for entry in entries)
+    removed = []
+    for entry in entries:
+        if size_bytes <= max_bytes and entry.version == _VERSION:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, entry.key), ignore_errors=True)
+        size_bytes -= entry.size_bytes
+        removed.append(entry)
+    return removed
+
+
+def verify_disk_cache(cache_dir=None, *, remove=False):
+    """Check the files of each cached dataset against their checksums.
+
+    Args:
+        cache_dir (str, optional): cache directory.  Defaults to None
+            (DEFAULT_CACHE_DIR).
+        remove (bool, optional): remove datasets that fail the check.
+            Defaults to False.
+
+    Returns:
+        dict of {key: error message} for the datasets that fail the check
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    errors = {}
+    for entry in list_disk_cache(cache_dir):
+        entry_dir = os.path.join(cache_dir, entry.key)
+        try:
+            with open(os.path.join(entry_dir, _META_FILE)) as f:
+                meta = json.load(f)
+            for name, checksum in meta['checksums'].items():
+                if _get_file_checksum(os.path.join(entry_dir, name)) != checksum:
+                    raise ValueError('checksum mismatch for {}'.format(name))
+        except (OSError, ValueError, KeyError) as e:
+            errors[entry.key] = str(e)
+            if remove:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+    return errors
+
+
+def _get_key(function, arguments):
+    """Return hash of the function, its arguments and the library and cache
+    versions."""
+    description = json.dumps({'function': function,
+                              'version': _VERSION,
+                              'arguments': {k: _describe(v)
+                                            for k, v in arguments.items()}},
+                             sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _describe(value):
+    """Return JSON-able description of an argument value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        content_hash = pd.util.hash_pandas_object(value, index=True).values
+        return {'pandas': hashlib.sha256(content_hash.tobytes()).hexdigest()}
+    if isinstance(value, dict):
+        return {str(k): _describe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_describe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError('Cannot describe argument of type {}'.format(type(value)))
+
+
+def _write_frame(entry_dir, df):
+    """Write the index and columns of df as .npy files, returning the meta
+    data needed to read them back."""
+    columns = [(df.index.name, df.index, True)]
+    columns += [(name, df[name], False) for name in df.columns]
+
+    meta = {'columns': [], 'checksums': {}}
+    for i, (name, values, is_index) in enumerate(columns):
+        column_meta = {'name': name, 'is_index': is_index,
+                       'file': '{}.npy'.format(i)}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column_meta['categories'] = values.cat.categories.tolist()
+            values = values.cat.codes
+        values = np.asarray(values)
+        if values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            if len(uniques) <= len(values) // 2:
+                # repeated strings (e.g. user IDs of sessions): store codes
+                # and the unique strings, which is faster to reload too
+                column_meta['uniques_file'] = '{}-uniques.npy'.format(i)
+                _save(entry_dir, column_meta['uniques_file'],
+                      _to_fixed_width(uniques, column_meta), meta)
+                values = codes
+            else:
+                values = _to_fixed_width(values, column_meta)
+        _save(entry_dir, column_meta['file'], values, meta)
+        meta['columns'].append(column_meta)
+    return meta
+
+
+def _to_fixed_width(values, column_meta):
+    """Return strings as fixed-width bytes (or unicode), as .npy can't
+    mmap object arrays."""
+    values = np.asarray(values, dtype=object)
+    try:
+        values = values.astype('S')
+        column_meta['kind'] = 'bytes'
+    except UnicodeEncodeError:
+        values = values.astype('U')
+        column_meta['kind'] = 'unicode'
+    return values
+
+
+def _save(entry_dir, file_name, values, meta):
+    path = os.path.join(entry_dir, file_name)
+    np.save(path, values)
+    meta['checksums'][file_name] = _get_file_checksum(path)
+
+
+def _read_frame(entry_dir, meta, *, mmap=False):
+    index = None
+    columns = {}
+    for column_meta in meta['columns']:
+        values = np.load(os.path.join(entry_dir, column_meta['file']),
+                         mmap_mode='r' if mmap else None)
+        if 'uniques_file' in column_meta:
+            uniques = np.load(os.path.join(entry_dir,
+                                           column_meta['uniques_file']))
+            values = _from_fixed_width(uniques, column_meta)[values]
+        elif 'kind' in column_meta:
+            values = _from_fixed_width(values, column_meta)
+        if 'categories' in column_meta:
+            values = pd.Categorical.from_codes(values,
+                                               column_meta['categories'])
+        if column_meta['is_index']:
+            index = pd.Index(values, name=column_meta['name'])
+        else:
+            columns[column_meta['name']] = values
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def _from_fixed_width(values, column_meta):
+    if column_meta['kind'] == 'bytes':
+        values = values.astype('U')
+    return values.astype(object)
+
+
+def _get_file_checksum(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='python -m src._disk_cache',
+        description='Manage the on-disk dataset cache.')
+    parser.add_argument('command', choices=['info', 'verify', 'clean'])
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--max-bytes', type=int, default=0,
+                        help='size limit for clean (default 0: remove all)')
+    parser.add_argument('--remove', action='store_true',
+                        help='remove datasets that fail verify')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        entries = list_disk_cache(args.cache_dir)
+        for entry in entries:
+            print('{}  {:>12,d} B  {}  {}  (v{})'.format(
+                entry.key[:16], entry.size_bytes,
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.last_used)),
+                entry.function, entry.version))
+        print('{} datasets, {:,d} bytes'.format(
+            len(entries), sum(entry.size_bytes for entry in entries)))
+    elif args.command == 'verify':
+        errors = verify_disk_cache(args.cache_dir, remove=args.remove)
+        for key, error in errors.items():
+            print('{}: {}'.format(key, error))
+        print('{} datasets failed verification'.format(len(errors)))
+        return 1 if errors else 0
+    else:
+        removed = clean_disk_cache(args.max_bytes, cache_dir=args.cache_dir)
+        print('removed {} datasets'.format(len(removed)))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,17 @@
+import functools
+
+
+ENGINES = ('numpy', 'numba')
+
+
+@functools.lru_cache(maxsize=None)
+def get_sample_user_positions_kernel():
+    """Return the Numba kernel to sample the positions of the active users
+    (src._numba_kernels.sample_user_positions), or None if numba is not
+    installed.  It is compiled on its first call, or loaded from the
+    on-disk cache of an earlier process."""
+    try:
+        from src import _numba_kernels
+    except ImportError:
+        return None
+    return _numba_kernels.sample_user_positions
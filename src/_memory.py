@@ -0,0 +1,71 @@
+import os
+import sys
+
+
+def get_rss_bytes():
+    """Return the resident set size (RSS) of this process in bytes (0 if
+    it can't be read on this platform)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def get_peak_rss_bytes():
+    """Return the peak resident set size (RSS high-water mark) of this
+    process in bytes, since it started or since the last reset_peak_rss."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS (Linux only),
+    returning whether it was reset.  This resets it for the whole process,
+    e.g. for any other code tracking its peak."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+class track_peak_rss:
+    """Context manager to measure the peak RSS of this process by the end of
+    the block, as peak_rss_bytes.
+
+    With reset=True, the peak is reset when entering the block (see
+    reset_peak_rss, for the whole process), so it is the peak within the
+    block.  Otherwise (or where the peak can't be reset, not Linux), it is
+    the peak since the process started or was last reset.
+
+    Example:
+        >>> with track_peak_rss(reset=True) as tracker:
+        ...     session_df = get_session_dataset(...)
+        >>> tracker.peak_rss_bytes
+    """
+
+    def __init__(self, *, reset=False):
+        self.reset = reset
+        self.peak_rss_bytes = None
+
+    def __enter__(self):
+        if self.reset:
+            reset_peak_rss()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.peak_rss_bytes = get_peak_rss_bytes()
@@ -0,0 +1,128 @@
+"""Kernels of the 'numba' engine, imported only when it is used (see
+src._kernels.get_sample_user_positions_kernel).
+
+The kernels are module-level functions compiled with cache=True, so new
+processes load the compiled code from __pycache__ rather than compiling it.
+"""
+import numba
+import numpy as np
+
+
+# SplitMix64 constants
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_TO_UNIT = 1.0 / 2 ** 53
+
+# sample of keys to estimate the threshold from, in _select_threshold
+_SELECT_SAMPLE_SIZE = 2 ** 14
+
+
+@numba.njit(cache=True, nogil=True)
+def _select_threshold(keys, k, buffer):
+    """Return the k-th smallest (k >= 1) of keys, given a scratch buffer of
+    at least len(keys).
+
+    The k-th smallest is estimated from a sample of the keys (Floyd-Rivest
+    selection), so only the keys near the estimate are partitioned.
+    """
+    n = len(keys)
+    if n < 4 * _SELECT_SAMPLE_SIZE:
+        return np.partition(keys, k - 1)[k - 1]
+
+    step = n // _SELECT_SAMPLE_SIZE
+    sample = np.sort(keys[:step * _SELECT_SAMPLE_SIZE:step])
+    rank = k * _SELECT_SAMPLE_SIZE // n
+    margin = int(3 * np.sqrt(_SELECT_SAMPLE_SIZE))
+    lower = sample[rank - margin] if rank >= margin else -np.inf
+    upper = (sample[rank + margin] if rank + margin < _SELECT_SAMPLE_SIZE
+             else np.inf)
+
+    # keys in [lower, upper) into the buffer, counting the keys below
+    n_below = 0
+    n_between = 0
+    for j in range(n):
+        if keys[j] < lower:
+            n_below += 1
+        elif keys[j] < upper:
+            buffer[n_between] = keys[j]
+            n_between += 1
+    if n_below < k <= n_below + n_between:
+        return np.partition(buffer[:n_between], k - n_below - 1)[k - n_below - 1]
+    # (rare) estimate missed the k-th smallest
+    return np.partition(keys, k - 1)[k - 1]
+
+
+@numba.njit(parallel=True, cache=True, nogil=True)
+def sample_user_positions(activation_days, score_weights, decay_weights,
+                          date_days, session_counts, date_seeds):
+    """Return positions of the active users for the sessions of each date,
+    as src.data._sample_user_positions, in one loop over plain arrays.
+
+    The existing users are drawn with exponential keys (see
+    sample_without_replacement), where the uniform draw of user j on date i
+    is a hash (SplitMix64) of date_seeds[i] and j.  So the draws do not
+    depend on how the date range is split up, nor on the number of threads.
+    """
+    n_users = len(activation_days)
+    positions = np.empty(session_counts.sum(), dtype=np.int64)
+    keys = np.empty(n_users)
+    buffer = np.empty(n_users)
+    block_start = 0
+    n_existing = 0
+    for i in range(len(date_days)):
+        # grow the pool: users activated before the date are existing
+        # users, users activated on the date are new users
+        while (n_existing < n_users
+               and activation_days[n_existing] < date_days[i]):
+            n_existing += 1
+        new_user_end = n_existing
+        while (new_user_end < n_users
+               and activation_days[new_user_end] == date_days[i]):
+            new_user_end += 1
+
+        # make all new users active for this day
+        n_new = new_user_end - n_existing
+        for j in range(n_new):
+            positions[block_start + j] = n_existing + j
+
+        n_draws = session_counts[i] - n_new
+        if n_draws > n_existing or n_draws < 0:
+            raise ValueError('Cannot take a larger sample than '
+                             'population when sampling without '
+                             'replacement')
+
+        # keep the existing users with the n_draws smallest keys
+        block_mid = block_start + n_new
+        if n_draws == n_existing:
+            for j in range(n_existing):
+                positions[block_mid + j] = j
+        elif n_draws > 0:
+            date_seed = np.uint64(date_seeds[i])
+            for j in numba.prange(n_existing):
+                z = date_seed + np.uint64(j + 1) * _GOLDEN_GAMMA
+                z = (z ^ (z >> np.uint64(30))) * _MIX_1
+                z = (z ^ (z >> np.uint64(27))) * _MIX_2
+                z = z ^ (z >> np.uint64(31))
+                # uniform on (0, 1) from the top 53 bits
+                uniform = ((z >> np.uint64(11)) + 0.5) * _TO_UNIT
+                weight = (score_weights[j]
+                          + decay_weights[date_days[i]
+                                          - activation_days[j]])
+                keys[j] = -np.log(uniform) / weight
+            threshold = _select_threshold(keys[:n_existing], n_draws, buffer)
+            n_kept = 0
+            for j in range(n_existing):
+                if keys[j] < threshold:
+                    positions[block_mid + n_kept] = j
+                    n_kept += 1
+            # ties at the threshold fill the rest
+            for j in range(n_existing):
+                if n_kept == n_draws:
+                    break
+                if keys[j] == threshold:
+                    positions[block_mid + n_kept] = j
+                    n_kept += 1
+        block_start += session_counts[i]
+
+    return positions
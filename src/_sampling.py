@@ -0,0 +1,49 @@
+import numpy as np
+
+
+SAMPLERS = ('choice', 'exponential')
+
+
+def sample_without_replacement(weights, n_draws, *, sampler='choice',
+                               rng=None):
+    """Draw n_draws positions of weights, with probability proportional to
+    the weights and without replacement.
+
+    Backends (sampler):
+    - 'choice': rng.choice with replace=False (sequential draws).
+    - 'exponential': exponential keys (Efraimidis-Spirakis), i.e. draw
+      E_i ~ Exp(1) per item and keep the n_draws smallest E_i / w_i.
+      This is one vectorized pass plus an argpartition, so it scales to
+      millions of items.
+
+    Both backends give the same distribution of samples.
+
+    Args:
+        weights (np.ndarray): positive weights (need not sum to 1).
+        n_draws (int): number of items to draw.
+        sampler (str, optional): sampling backend, 'choice' or
+            'exponential'. Defaults to 'choice'.
+        rng (np.random.Generator, optional): random generator to draw from.
+            Defaults to None (new unseeded generator).
+
+    Returns:
+        np.ndarray: positions of the drawn items.
+    """
+    weights = np.asarray(weights, dtype=float)
+    rng = np.random.default_rng() if rng is None else rng
+    n_draws = int(n_draws)
+    if n_draws > len(weights):
+        raise ValueError('Cannot take a larger sample than population '
+                         'when sampling without replacement')
+
+    if sampler == 'choice':
+        return rng.choice(len(weights), size=n_draws, replace=False,
+                          p=weights / weights.sum())
+    if sampler == 'exponential':
+        keys = rng.exponential(size=len(weights)) / weights
+        if n_draws == len(weights):
+            return np.arange(n_draws)
+        return np.argpartition(keys, n_draws)[:n_draws]
+
+    raise ValueError("sampler must be one of {}, got '{}'"
+                     .format(SAMPLERS, sampler))
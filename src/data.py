@@ -1,14 +1,68 @@
-import uuid
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+from collections import namedtuple
 import pandas as pd
 import numpy as np
-from scipy.stats import skewnorm
 
-from src._user_growth import get_user_counts_by_date, get_active_user_counts_by_date
+from src._user_growth import (get_user_counts_by_date, get_active_user_counts_by_date,
+                              _get_rng, _get_stream_rng, _get_seed_sequence)
+from src._kernels import ENGINES, get_sample_user_positions_kernel
+from src._sampling import sample_without_replacement
+from src._cache import memoize
+from src._disk_cache import disk_cached
+from src._memory import get_rss_bytes, track_peak_rss
 
 
+# parameters of the stickiness decay by days since activation:
+# amplitude * rate ** days_since_activation + floor, then scaled by scale
+# before blending with the UUID stickiness score
+STICKINESS_DECAY_PARAMS = {'amplitude': 0.8, 'rate': 0.9, 'floor': 0.1,
+                           'scale': 40}
+
+# ASCII codes of the hex digits, and the positions of the hex digits in the
+# 36-character UUID string (the rest are the '-' separators)
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+_UUID_HEX_POSITIONS = np.array([i for i in range(36)
+                                if i not in (8, 13, 18, 23)])
+
+# formats of the user and session IDs: UUID strings, or dense integer keys
+# (with the UUIDs of the users kept as two uint64 columns, see get_user_ids)
+ID_FORMATS = ('uuid', 'int')
+
+# backends of the skew-normal draws of the ages
+AGE_BACKENDS = ('numpy', 'scipy')
+
+# default weights of the user countries (normalised to sum to 1)
+COUNTRY_WEIGHTS = {'US': 0.8, 'CA': 0.2}
+
+# users per batch of iter_user_batches
+USER_CHUNK_SIZE = 1_000_000
+
+# estimates for the memory budget of get_session_dataset (max_memory_bytes):
+# bytes per user of the sorted user pool, the user columns and the per-date
+# sampling temporaries (weights, keys, partition)
+_POOL_BYTES_PER_USER = 96
+# bytes per session of the positions and rows of the users of a batch
+_BATCH_BYTES_PER_SESSION = 16
+# bytes of a UUID str object (besides the pointer to it)
+_UUID_STR_BYTES = sys.getsizeof('0' * 36)
+# periods to batch the dates by within a memory budget, largest first
+_BUDGET_BATCH_FREQS = ('Y', 'Q', 'M', 'W', 'D')
+
+_SessionMemoryPlan = namedtuple('SessionMemoryPlan',
+                                ['batch_freq', 'spill', 'estimated_bytes'])
+
+
+@memoize
+@disk_cached
 def get_user_dataset(start_date, end_date, *,
                      approx_yoy_growth_rate=3, start_users=10000,
-                     seed=None):
+                     seed=None, rng=None, id_format='uuid',
+                     age_backend='numpy', country_weights=None):
     """Get dataset of user account information, e.g. activation date,
     age, country.
     Given these parameters used to simulate the SaaS business:
@@ -24,92 +78,574 @@ def get_user_dataset(start_date, end_date, *,
         start_users (int, optional): Number of users at the start date.
             Defaults to 10000.
         seed (int, optional): Random seed. Defaults to None.
+        rng (np.random.Generator, optional): random generator to draw from
+            instead of seed. Defaults to None.
+        id_format (str, optional): 'uuid' to index the users by user_id
+            (UUID strings), or 'int' to index them by user_key (dense
+            integers, 0 to n - 1) with the UUIDs as uint64 columns uuid_hi
+            and uuid_lo instead (see get_user_ids).  The users are the same
+            either way.  Defaults to 'uuid'.
+        age_backend (str, optional): 'numpy', or 'scipy' to draw the ages
+            with scipy.stats.skewnorm (imported only then).  Both give the
+            same ages.  Defaults to 'numpy'.
+        country_weights (dict, optional): weights of the user countries by
+            country name, e.g. {'US': 3, 'CA': 1, 'GB': 1}.  The country
+            column is a pd.Categorical of the countries (sorted).  Defaults
+            to None (COUNTRY_WEIGHTS).
 
     Returns:
         pd.DataFrame
     """
-    columns = ['user_id', 'activation_date', 'country', 'age']
-
     new_users_by_date = _get_new_user_counts_by_date(start_date, end_date,
-                                                     seed=seed,
+                                                     seed=seed, rng=rng,
                                                      approx_yoy_growth_rate=approx_yoy_growth_rate,
                                                      start_users=start_users)
+    return _build_user_dataset(new_users_by_date, start_users=start_users,
+                               seed=seed, rng=rng, id_format=id_format,
+                               age_backend=age_backend,
+                               country_weights=country_weights)
+
+
+def _build_user_dataset(new_users_by_date, *, start_users,
+                        seed=None, rng=None, id_format='uuid',
+                        age_backend='numpy', country_weights=None):
+    """Return the user dataset for a given trajectory of new users."""
+    if id_format not in ID_FORMATS:
+        raise ValueError("id_format must be one of {}, got '{}'"
+                         .format(ID_FORMATS, id_format))
+    columns = ['user_id', 'activation_date', 'country', 'age']
 
     new_users_over_time = new_users_by_date.sum()
     total_users = int(start_users + new_users_over_time)
 
     user_df = pd.DataFrame(columns=columns)
-    user_df['user_id'] = _get_uuid_values(total_users)  # not seeded
-    user_df['age'] = _get_age_dist_values(total_users, seed=seed)
-    user_df['country'] = _get_user_country_values(total_users, seed=seed)
+    if id_format == 'int':
+        raw_ids = _get_uuid_values(total_users, stream='user_id',
+                                   seed=seed, rng=rng, as_int=True)
+        user_df = pd.DataFrame(columns=columns[1:],
+                               index=pd.RangeIndex(total_users,
+                                                   name='user_key'))
+        user_df['uuid_hi'] = raw_ids[:, 0]
+        user_df['uuid_lo'] = raw_ids[:, 1]
+    else:
+        user_df['user_id'] = _get_uuid_values(total_users, stream='user_id',
+                                              seed=seed, rng=rng)
+    user_df['age'] = _get_age_dist_values(total_users, seed=seed, rng=rng,
+                                          backend=age_backend)
+    user_df['country'] = _get_user_country_values(
+        total_users, seed=seed, rng=rng, country_weights=country_weights)
     user_df = user_df.pipe(_fill_activation_dates,
                            new_users_by_date=new_users_by_date,
-                           start_users=start_users)
+                           start_users=start_users,
+                           seed=seed, rng=rng)
+    if id_format == 'int':
+        return user_df
     return user_df.set_index('user_id')
 
 
+def get_user_ids(user_keys, *, users_df):
+    """Return the UUID strings (user_id) of the users with the given
+    integer keys, e.g. the user_key column of a session dataset, for a
+    user dataset from get_user_dataset(..., id_format='int').
+
+    Args:
+        user_keys (array-like): user keys (the index of users_df).
+        users_df (pd.DataFrame): user dataset with uuid_hi and uuid_lo
+            columns.
+
+    Returns:
+        pd.Series of the user IDs (aligned with user_keys if it is a
+        pd.Series, else indexed by user key)
+    """
+    positions = users_df.index.get_indexer(np.asarray(user_keys))
+    if (positions < 0).any():
+        raise KeyError('user_keys not in users_df: {}'.format(
+            np.asarray(user_keys)[positions < 0][:5].tolist()))
+    raw_ids = np.column_stack([users_df['uuid_hi'].values[positions],
+                               users_df['uuid_lo'].values[positions]])
+    index = (user_keys.index if isinstance(user_keys, pd.Series)
+             else pd.Index(user_keys, name=users_df.index.name))
+    return pd.Series(_format_uuid_values(raw_ids), index=index,
+                     name='user_id')
+
+
+def _get_key_dtype(n):
+    """Return the smallest integer dtype (int32 or int64) for n keys."""
+    return np.int32 if n <= np.iinfo(np.int32).max else np.int64
+
+
+def _is_int_id_format(users_df):
+    return 'uuid_hi' in users_df.columns and 'uuid_lo' in users_df.columns
+
+
 def _get_new_user_counts_by_date(start_date, end_date, *,
                                  approx_yoy_growth_rate=3, start_users=10000,
-                                 seed=None):
+                                 seed=None, rng=None):
     users_by_date = get_user_counts_by_date(start_date, end_date,
-                                            seed=seed,
+                                            seed=seed, rng=rng,
                                             approx_yoy_growth_rate=approx_yoy_growth_rate,
                                             start_users=start_users)
+    return _get_new_user_counts(users_by_date)
+
+
+def _get_new_user_counts(users_by_date):
     return users_by_date - users_by_date.shift(1)
 
 
-def _get_uuid_values(n):
-    ids_list = [str(uuid.uuid4())
-                for i in range(n)]
-    return ids_list
+def _get_uuid_values(n, *, stream='uuid', seed=None, rng=None,
+                     as_int=False):
+    """Return array of n random (version 4) UUID strings, drawn from 16
+    random bytes per ID.
+
+    With as_int=True, return the raw 128-bit IDs as a (n, 2) uint64 array
+    (high, low 64 bits) instead, with no string formatting.
+    """
+    rng = _get_stream_rng(stream, seed, rng)
+    id_bytes = (np.frombuffer(rng.bytes(16 * n), dtype=np.uint8)
+                .reshape(n, 16).copy())
+    # set version (4) and variant (RFC 4122) bits, as uuid.uuid4()
+    id_bytes[:, 6] = (id_bytes[:, 6] & 0x0f) | 0x40
+    id_bytes[:, 8] = (id_bytes[:, 8] & 0x3f) | 0x80
+
+    if as_int:
+        return id_bytes.view('>u8').astype(np.uint64)
+    return _format_uuid_values(id_bytes)
+
+
+def _format_uuid_values(id_bytes):
+    """Return array of UUID strings (xxxxxxxx-xxxx-...), given a (n, 16)
+    uint8 array of UUID bytes or a (n, 2) uint64 array of 128-bit IDs."""
+    if id_bytes.dtype != np.uint8:
+        id_bytes = id_bytes.astype('>u8').view(np.uint8)
+    id_bytes = id_bytes.reshape(-1, 16)
+
+    # ASCII codes of the UUID strings, filled in with two hex digits per byte
+    id_chars = np.full((len(id_bytes), 36), ord('-'), dtype=np.uint8)
+    id_chars[:, _UUID_HEX_POSITIONS[0::2]] = _HEX_DIGITS[id_bytes >> 4]
+    id_chars[:, _UUID_HEX_POSITIONS[1::2]] = _HEX_DIGITS[id_bytes & 0x0f]
+    return id_chars.view('S36').ravel().astype(str).astype(object)
 
 
-def _get_age_dist_values(total_users, *, seed=None):
+def _get_age_dist_values(total_users, *, seed=None, rng=None,
+                         backend='numpy'):
     """Return Numpy array of age values, given total_users"""
-    if seed:
-        np.random.seed(seed)
+    rng = _get_rng(seed, rng)
 
     # negative skewnorm dist - age range of 16 to 60 ish
-    return ((27 + 10 * skewnorm.rvs(a=2, size=total_users))
+    if backend == 'scipy':
+        from scipy.stats import skewnorm
+        skewnorm_values = skewnorm.rvs(a=2, size=total_users,
+                                       random_state=rng)
+    elif backend == 'numpy':
+        skewnorm_values = _draw_skewnorm_values(2, total_users, rng=rng)
+    else:
+        raise ValueError("backend must be one of {}, got '{}'"
+                         .format(AGE_BACKENDS, backend))
+    return _to_age_values(skewnorm_values)
+
+
+def _to_age_values(skewnorm_values):
+    return ((27 + 10 * skewnorm_values)
             .astype(int)
             .clip(min=16))
 
 
-def _get_user_country_values(total_users, *, seed=None):
-    if seed:
-        np.random.seed(seed)
+def _draw_skewnorm_values(a, size, *, rng, z1_rng=None):
+    """Return size draws of the skew-normal distribution with shape a, as
+    delta * |Z0| + sqrt(1 - delta ** 2) * Z1, delta = a / sqrt(1 + a ** 2).
+
+    Z1 has its sign flipped where Z0 < 0 (the same distribution), which
+    gives the same values as scipy.stats.skewnorm.rvs for the same rng.
+    Z1 is drawn from z1_rng if given (a copy of rng advanced past all the
+    Z0 draws, to draw in chunks), else after Z0 from rng.
+    """
+    z0 = rng.normal(size=size)
+    z1 = (z1_rng if z1_rng is not None else rng).normal(size=size)
+    delta = a / np.sqrt(1 + a ** 2)
+    values = delta * z0 + z1 * np.sqrt(1 - delta ** 2)
+    return np.where(z0 >= 0, values, -values)
+
+
+def _get_user_country_values(total_users, *, seed=None, rng=None,
+                             country_weights=None):
+    """Return pd.Categorical of total_users countries, drawn with the
+    country_weights (see get_user_dataset).
+
+    The countries are drawn as integer codes, by searchsorted of uniform
+    draws on the cumulative weights (the same draws as rng.choice with
+    p=weights), over the countries in sorted order.
+    """
+    rng = _get_rng(seed, rng)
+    categories, weights = _get_country_weights(country_weights)
+
+    cumulative_weights = weights.cumsum()
+    cumulative_weights /= cumulative_weights[-1]
+    codes = cumulative_weights.searchsorted(rng.random(total_users),
+                                            side='right')
+    # (stored as int8 codes for up to 127 countries, int16 up to 32767)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
 
-    num_vals = np.random.choice([0, 1], p=[0.2, 0.8],
-                                size=total_users)
-    return np.where(num_vals == 1, 'US', 'CA')
+def _get_country_weights(country_weights=None):
+    """Return the countries (sorted) and their weights, as arrays."""
+    if country_weights is None:
+        country_weights = COUNTRY_WEIGHTS
+    if not country_weights:
+        raise ValueError('country_weights must not be empty')
+    categories = sorted(country_weights)
+    weights = np.array([country_weights[country] for country in categories],
+                       dtype=float)
+    if (weights < 0).any() or not weights.sum() > 0:
+        raise ValueError('country_weights must be non-negative, with a '
+                         'positive sum, got {}'.format(country_weights))
+    return np.array(categories, dtype=object), weights
 
 
-def _fill_activation_dates(df, *, new_users_by_date, start_users, seed=None):
-    # legacy users - assume dates uniformly distributed in year before:
-    legacy_end_date = new_users_by_date.index.min()
+def _fill_activation_dates(df, *, new_users_by_date, start_users,
+                           seed=None, rng=None):
+    date_values = _get_activation_date_values(new_users_by_date,
+                                              start_users=start_users,
+                                              seed=seed, rng=rng)
+    # pandas stores datetime64[ns] (and is slow to convert other units)
+    return df.assign(activation_date=date_values.astype('datetime64[ns]'))
+
+
+def _get_activation_date_values(new_users_by_date, *, start_users,
+                                seed=None, rng=None):
+    """Return datetime64[D] array of the activation dates of the start_users
+    legacy users, then of the new users by date.
+
+    The dates are computed as integer day offsets: one draw of the legacy
+    users' days and np.repeat of the new users' dates by their counts.
+    """
+    rng = _get_rng(seed, rng)
+    legacy_dates = _get_legacy_activation_date_values(
+        new_users_by_date.index.min(), start_users=start_users, rng=rng)
+
+    # repeat the dates based on counts
+    new_user_dates, new_user_counts = _get_new_user_dates(new_users_by_date)
+    new_dates = np.repeat(new_user_dates, new_user_counts)
+    return np.concatenate([legacy_dates, new_dates])
+
+
+def _get_legacy_activation_date_values(start_date, *, start_users, rng):
+    """Return datetime64[D] array of the activation dates of the
+    start_users legacy users, uniformly distributed in the year before
+    start_date."""
+    legacy_end_date = start_date
     legacy_start_date = legacy_end_date - pd.DateOffset(years=1)
-    legacy_user_date_range = pd.date_range(legacy_start_date, legacy_end_date,
-                                           closed='left').to_series()
+    n_legacy_days = (legacy_end_date - legacy_start_date).days
+    # same draws as sampling the year's dates (with replacement)
+    legacy_days = (rng.integers(0, n_legacy_days, size=start_users)
+                   if isinstance(rng, np.random.Generator)
+                   else rng.randint(0, n_legacy_days, size=start_users))
+    return np.datetime64(legacy_start_date.date(), 'D') + legacy_days
+
+
+def _get_new_user_dates(new_users_by_date):
+    """Return the dates (datetime64[D]) and counts of the new users (no
+    count for the first date)."""
+    new_user_counts = new_users_by_date.values
+    has_count = ~np.isnan(new_user_counts)
+    return (new_users_by_date.index.values[has_count].astype('datetime64[D]'),
+            new_user_counts[has_count].astype(np.int64))
+
+
+def iter_user_batches(start_date, end_date, *,
+                      approx_yoy_growth_rate=3, start_users=10000,
+                      seed=None, rng=None, id_format='uuid',
+                      country_weights=None, chunk_size=USER_CHUNK_SIZE,
+                      as_dict=False):
+    """Generate the user dataset in batches of up to chunk_size users, in
+    activation date order, rather than as one DataFrame.
+
+    Each column is drawn a chunk at a time, from a copy of its random
+    stream advanced to the first user of the chunk, so the users do not
+    depend on chunk_size: the batches together are the same as
+    get_user_dataset(...).sort_values('activation_date', kind='stable').
+    Memory is proportional to chunk_size, except for the start_users legacy
+    users, which are drawn (and sorted by date) at once.  Advancing the
+    streams costs about as much time again as the draws themselves.
+
+    Args:
+        start_date (str): Y-m-d date string for the start of the series.
+        end_date (str): Y-m-d date string for the end of the series.
+        approx_yoy_growth_rate (int, optional): YoY growth rate for the
+            user count (>=1), e.g. 2 for +100%, 3 for +200%. Defaults to 3.
+        start_users (int, optional): Number of users at the start date.
+            Defaults to 10000.
+        seed (int, optional): Random seed. Defaults to None.
+        rng (np.random.Generator, optional): random generator to draw from
+            instead of seed. Defaults to None.
+        id_format (str, optional): 'uuid' or 'int' (see get_user_dataset).
+            Defaults to 'uuid'.
+        country_weights (dict, optional): weights of the user countries
+            (see get_user_dataset).  Defaults to None (COUNTRY_WEIGHTS).
+        chunk_size (int, optional): users per batch.  Defaults to
+            USER_CHUNK_SIZE.
+        as_dict (bool, optional): yield dicts of arrays (the user ID, then
+            the columns) instead of DataFrames indexed by user ID.  Defaults
+            to False.
+
+    Yields:
+        pd.DataFrame (or dict of arrays) of the users in each batch
+    """
+    new_users_by_date = _get_new_user_counts_by_date(start_date, end_date,
+                                                     seed=seed, rng=rng,
+                                                     approx_yoy_growth_rate=approx_yoy_growth_rate,
+                                                     start_users=start_users)
+    yield from _iter_user_batches(new_users_by_date, start_users=start_users,
+                                  seed=seed, rng=rng, id_format=id_format,
+                                  country_weights=country_weights,
+                                  chunk_size=chunk_size, as_dict=as_dict)
+
+
+def _iter_user_batches(new_users_by_date, *, start_users, seed=None,
+                       rng=None, id_format='uuid', country_weights=None,
+                       chunk_size=USER_CHUNK_SIZE, as_dict=False):
+    if id_format not in ID_FORMATS:
+        raise ValueError("id_format must be one of {}, got '{}'"
+                         .format(ID_FORMATS, id_format))
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive, got {}'
+                         .format(chunk_size))
+    new_user_dates, new_user_counts = _get_new_user_dates(new_users_by_date)
+    new_user_ends = new_user_counts.cumsum()
+    total_users = int(start_users + new_user_counts.sum())
+    streams = _get_user_streams(total_users, seed=seed, rng=rng,
+                                chunk_size=chunk_size)
+
+    def to_batch(columns):
+        if as_dict:
+            return columns
+        id_name = next(iter(columns))
+        return pd.DataFrame(columns).set_index(id_name)
+
+    # legacy users, sorted by activation date
+    legacy_dates = _get_legacy_activation_date_values(
+        new_users_by_date.index.min(), start_users=start_users,
+        rng=streams.activation_date)
+    if rng is not None:
+        # leave rng as get_user_dataset would
+        _set_rng_state(rng, streams.activation_date)
+    legacy_users = _draw_user_columns(legacy_dates, key_start=0,
+                                      streams=streams, id_format=id_format,
+                                      country_weights=country_weights)
+    order = np.argsort(legacy_dates, kind='stable')
+    for start in range(0, start_users, chunk_size):
+        rows = order[start:start + chunk_size]
+        yield to_batch({name: values[rows]
+                        for name, values in legacy_users.items()})
+    del legacy_users
+
+    # new users, in the order of their dates
+    for start in range(0, total_users - start_users, chunk_size):
+        new_user_rows = np.arange(start, min(start + chunk_size,
+                                             total_users - start_users))
+        dates = new_user_dates[new_user_ends.searchsorted(new_user_rows,
+                                                          side='right')]
+        yield to_batch(_draw_user_columns(dates, key_start=start_users + start,
+                                          streams=streams,
+                                          id_format=id_format,
+                                          country_weights=country_weights))
+
+
+_UserStreams = namedtuple('UserStreams', ['user_id', 'age', 'age_z1',
+                                          'country', 'activation_date'])
+
+
+def _get_user_streams(total_users, *, seed=None, rng=None,
+                      chunk_size=USER_CHUNK_SIZE):
+    """Return _UserStreams of the random generators for each user column,
+    at the first draw of the column in _build_user_dataset.
+
+    For a seed, the columns have their own streams (as in
+    _build_user_dataset), but the second normal draws of the ages follow
+    the first.  An rng is shared by the columns, one after the other.
+    Either way, a stream that follows other draws is a copy of the stream
+    advanced past them (in chunks).
+    """
+    def advance(stream, draw):
+        stream = copy.deepcopy(stream)
+        for start in range(0, total_users, chunk_size):
+            draw(stream, min(chunk_size, total_users - start))
+        return stream
+
+    def draw_id_bytes(stream, n):
+        stream.bytes(16 * n)
+
+    def draw_normals(stream, n):
+        stream.normal(size=n)
+
+    def draw_uniforms(stream, n):
+        stream.random(n)
+
+    if rng is None:
+        age_stream = _get_rng(seed)
+        return _UserStreams(user_id=_get_stream_rng('user_id', seed),
+                            age=age_stream,
+                            age_z1=advance(age_stream, draw_normals),
+                            country=_get_rng(seed),
+                            activation_date=_get_rng(seed))
+    user_id_stream = copy.deepcopy(rng)
+    age_stream = advance(user_id_stream, draw_id_bytes)
+    age_z1_stream = advance(age_stream, draw_normals)
+    country_stream = advance(age_z1_stream, draw_normals)
+    return _UserStreams(user_id=user_id_stream, age=age_stream,
+                        age_z1=age_z1_stream, country=country_stream,
+                        activation_date=advance(country_stream,
+                                                draw_uniforms))
+
+
+def _set_rng_state(rng, from_rng):
+    """Set the state of rng to that of from_rng (a copy of it)."""
+    if isinstance(rng, np.random.Generator):
+        rng.bit_generator.state = from_rng.bit_generator.state
+    else:
+        rng.set_state(from_rng.get_state())
 
-    legacy_dates = (legacy_user_date_range
-                    .sample(start_users,
-                            replace=True,
-                            random_state=seed)
-                    .reset_index(drop=True))
 
-    # repeat the dates based on value counts
-    new_dates = pd.Series((new_users_by_date.dropna()
-                           .repeat(new_users_by_date.dropna()))
-                          .index.values)
-    # concat the legacy & new activation dates
-    date_values = (pd.concat([legacy_dates, new_dates],
-                             ignore_index=True).values)
-    return df.assign(activation_date=lambda x: date_values)
+def _draw_user_columns(activation_dates, *, key_start, streams, id_format,
+                       country_weights=None):
+    """Return dict of the columns of the users with the given activation
+    dates (as get_user_dataset), drawn from the next draws of streams."""
+    n = len(activation_dates)
+    if id_format == 'int':
+        raw_ids = _get_uuid_values(n, rng=streams.user_id, as_int=True)
+        columns = {'user_key': np.arange(key_start, key_start + n)}
+    else:
+        columns = {'user_id': _get_uuid_values(n, rng=streams.user_id)}
+    columns['activation_date'] = activation_dates.astype('datetime64[ns]')
+    columns['country'] = _get_user_country_values(
+        n, rng=streams.country, country_weights=country_weights)
+    columns['age'] = _to_age_values(_draw_skewnorm_values(
+        2, n, rng=streams.age, z1_rng=streams.age_z1))
+    if id_format == 'int':
+        columns['uuid_hi'] = raw_ids[:, 0]
+        columns['uuid_lo'] = raw_ids[:, 1]
+    return columns
 
 
+def iter_session_batches(start_date, end_date, *, users_df,
+                         approx_yoy_growth_rate=3, start_users=10000,
+                         seed=None, rng=None, sampler='choice',
+                         stickiness_decay=None, engine='numpy',
+                         include_user_columns=None, freq='D', as_dict=False):
+    """Generate the session dataset in batches of dates (e.g. per day or
+    per month), rather than as one DataFrame.
+
+    Only the user pool (users sorted by activation date) and one batch of
+    sessions are held in memory, so sessions can be piped into a file
+    writer or a load test with bounded memory.  For a seed, the batches
+    together are the same as get_session_dataset.
+
+    Args:
+        start_date (str): Y-m-d date string for the start of the series.
+        end_date (str): Y-m-d date string for the end of the series.
+        users_df (pd.DataFrame): user data to utilise in the data
+            generation process for this session-level dataset.
+        approx_yoy_growth_rate (int, optional): YoY growth rate for the
+            user count (>=1), e.g. 2 for +100%, 3 for +200%. Defaults to 3.
+        start_users (int, optional): Number of users at the start date.
+            Defaults to 10000.
+        seed (int): Random seed.  This should be the same as the seed used
+            to generate users_df.
+        rng (np.random.Generator, optional): random generator to draw from
+            instead of seed (see get_session_dataset).  Defaults to None.
+        sampler (str, optional): backend for the weighted sampling of
+            active users, 'choice' or 'exponential'.  Defaults to 'choice'.
+        stickiness_decay (dict, optional): overrides for
+            STICKINESS_DECAY_PARAMS.  Defaults to None.
+        engine (str, optional): 'numpy' or 'numba' (see
+            get_session_dataset).  Defaults to 'numpy'.
+        include_user_columns (list of str, optional): columns of users_df
+            to add to the sessions, prefixed with 'user_' (see
+            get_session_dataset).  Defaults to None.
+        freq (str, optional): pandas period alias for the batches, e.g.
+            'D' (day), 'W' (week), 'M' (month).  Defaults to 'D'.
+        as_dict (bool, optional): yield dicts of NumPy arrays (session_id,
+            user_id, session_start_date) instead of DataFrames indexed by
+            session_id.  With integer user keys in users_df, the IDs are
+            session_key and user_key (see get_session_dataset).  Defaults to
+            False.
+
+    Yields:
+        pd.DataFrame (or dict of np.ndarray) of the sessions in each batch
+    """
+    active_user_counts = get_active_user_counts_by_date(
+        start_date, end_date,
+        approx_yoy_growth_rate=approx_yoy_growth_rate,
+        start_users=start_users,
+        seed=seed, rng=rng)
+    yield from _iter_session_batches(active_user_counts, users_df=users_df,
+                                     seed=seed, rng=rng, sampler=sampler,
+                                     stickiness_decay=stickiness_decay,
+                                     engine=engine,
+                                     include_user_columns=include_user_columns,
+                                     freq=freq, as_dict=as_dict)
+
+
+def _iter_session_batches(active_user_counts, *, users_df, seed=None,
+                          rng=None, sampler='choice', stickiness_decay=None,
+                          engine='numpy', include_user_columns=None,
+                          freq='D', as_dict=False,
+                          categorical_user_columns=False):
+    engine = _get_engine(engine)
+    dates = active_user_counts.index
+    date_days = dates.values.astype('datetime64[D]').astype(np.int64)
+    session_counts = active_user_counts.values.astype(np.int64)
+    user_rows, activation_days, score_weights, decay_weights = _get_user_pool(
+        users_df, date_days=date_days, stickiness_decay=stickiness_decay)
+    date_seeds, bit_generator = _get_date_streams(len(date_days),
+                                                  seed=seed, rng=rng)
+    session_id_rng = _get_stream_rng('session_id', seed, rng)
+    id_names = _get_session_id_names(users_df)
+    user_columns = _get_user_columns(
+        users_df, include_user_columns=include_user_columns,
+        categorical=categorical_user_columns)
+
+    # batches start where the period (of freq) of the dates changes
+    periods = dates.to_period(freq)
+    batch_starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    batch_ends = np.r_[batch_starts[1:], len(dates)]
+
+    session_key_start = 0
+    for batch_start, batch_end in zip(batch_starts, batch_ends):
+        batch = slice(batch_start, batch_end)
+        positions = _sample_user_positions(activation_days=activation_days,
+                                           score_weights=score_weights,
+                                           decay_weights=decay_weights,
+                                           date_days=date_days[batch],
+                                           session_counts=session_counts[batch],
+                                           date_seeds=date_seeds[batch],
+                                           bit_generator=bit_generator,
+                                           sampler=sampler,
+                                           engine=engine)
+        sessions = _get_session_columns(
+            id_names[0],
+            _get_session_ids(len(positions), users_df=users_df,
+                             key_start=session_key_start,
+                             rng=session_id_rng),
+            user_rows[positions],
+            np.repeat(dates.values[batch], session_counts[batch]),
+            user_columns=user_columns)
+        session_key_start += len(positions)
+        if as_dict:
+            yield sessions
+        else:
+            yield pd.DataFrame(sessions).set_index(id_names[0])
+
+
+# with max_memory_bytes, the result has categorical user columns and attrs
+@disk_cached(ignore=('n_jobs', 'executor', 'spill_dir'),
+             bypass=('max_memory_bytes',))
 def get_session_dataset(start_date, end_date, *, users_df,
                         approx_yoy_growth_rate=3, start_users=10000,
-                        seed=None):
+                        seed=None, rng=None, sampler='choice',
+                        stickiness_decay=None, engine='numpy',
+                        include_user_columns=None, n_jobs=None,
+                        executor=None, max_memory_bytes=None,
+                        spill_dir=None):
     """Get dataset of session activity, e.g. session timestamps, indexed
     by session_id.
     Pass in the user dataset as users_df and the arguments used to generate
@@ -121,6 +657,12 @@ def get_session_dataset(start_date, end_date, *, users_df,
         - approx_yoy_growth_rate of users (people who have signed up in total)
         - start_users (number of users on start date)
 
+    If users_df has integer user keys (id_format='int'), the sessions are
+    indexed by session_key (int64) with the user_key of each session
+    (int32, or int64 for more than 2 ** 31 - 1 users), rather than by
+    UUID strings, and the same users are active as with UUIDs.  Use
+    get_user_ids for the UUIDs of the user keys.
+
     With the session dataset returned and users_df joined together, you
     can calculate interesting product metrics such as active users over time,
     user retention over time, etc.
@@ -136,6 +678,56 @@ def get_session_dataset(start_date, end_date, *, users_df,
             Defaults to 10000.
         seed (int): Random seed.  This should be the same as the seed used
             to generate users_df.
+        rng (np.random.Generator, optional): random generator to draw from
+            instead of seed.  The user counts it draws must match the ones
+            used for users_df: pass a generator in the state the one for
+            get_user_dataset was in (e.g. both np.random.default_rng(1)), as
+            both draw the user counts first.  Or see Simulation.  Defaults
+            to None.
+        sampler (str, optional): backend for the weighted sampling of
+            active users, 'choice' or 'exponential' (faster for large
+            user bases, same distribution).  Defaults to 'choice'.
+        stickiness_decay (dict, optional): overrides for
+            STICKINESS_DECAY_PARAMS ('amplitude', 'rate', 'floor', 'scale'),
+            which shape how quickly users stop being active after
+            activation.  Defaults to None (use STICKINESS_DECAY_PARAMS).
+        engine (str, optional): 'numpy', or 'numba' to run the whole loop
+            over the dates in one function compiled with Numba (with the
+            'exponential' sampler and Numba's random generator, so the
+            draws differ from 'numpy').  Falls back to 'numpy', with a
+            warning, if numba is not installed.  Defaults to 'numpy'.
+        include_user_columns (list of str, optional): columns of users_df
+            to add to the sessions, prefixed with 'user_', e.g.
+            ['activation_date'] for user_activation_date.  They are taken
+            from the rows of the active users as they are sampled, so no
+            merge with users_df is needed.  Defaults to None.
+        n_jobs (int, optional): number of worker processes to sample the
+            sessions with, where the date range is split into shards
+            (-1 for all CPUs).  The workers are started with forkserver (or
+            spawn), not forked, so scripts need an
+            `if __name__ == '__main__':` guard.  Not supported with
+            engine='numba'.  Defaults to None (no process pool).
+        executor (concurrent.futures.Executor, optional): executor to run
+            the shards on instead of a new process pool.  Not supported
+            with engine='numba'.  Defaults to None.
+        max_memory_bytes (int, optional): memory budget of the process
+            (RSS) while generating the dataset.  The sessions are then
+            sampled in one process, in batches of dates (the largest of
+            year, quarter, month, week or day that fits), into preallocated
+            columns, with string user columns as categoricals.  If the
+            dataset itself doesn't fit, its columns are spilled to files in
+            spill_dir and returned memory-mapped (this needs integer keys,
+            see get_user_dataset).  The peak RSS and the plan used are in
+            the attrs of the DataFrame ('peak_rss_bytes', 'memory_plan'),
+            where the peak is that of the process so far (it is not reset,
+            so call src._memory.reset_peak_rss() first to measure this call
+            alone).  Raises MemoryError if the budget is too small.
+            Defaults to None (no budget).
+        spill_dir (str, optional): directory for the spilled columns.
+            Defaults to None (system temp directory).
+
+    Each date draws from its own random stream (derived from the seed), so
+    the dataset is the same for a given seed whatever n_jobs is used.
 
     Returns:
         pd.DataFrame
@@ -144,95 +736,499 @@ def get_session_dataset(start_date, end_date, *, users_df,
         start_date, end_date,
         approx_yoy_growth_rate=approx_yoy_growth_rate,
         start_users=start_users,
-        seed=seed)
-
-    # define initial col order
-    columns = ['session_id', 'user_id', 'session_start_date']
-
-    activity_df = pd.DataFrame(columns=columns)
-    activity_df['session_start_date'] = pd.Series((active_user_counts.dropna()
-                                                   .repeat(active_user_counts.dropna()))
-                                                  .index.values)
-    activity_df['session_id'] = _get_uuid_values(len(activity_df))  # not seeded
-    # choose active user IDs via a sampling function
-    activity_df = (activity_df
-                   .pipe(_sample_user_ids,
-                         users_df=users_df,
-                         active_user_counts=active_user_counts,
-                         start_date=start_date,
-                         end_date=end_date,
-                         seed=seed)
-                   .drop(columns=['user_activation_date'])  # drop joined col
-                   )
-
-    return activity_df.set_index('session_id')
-
-
-def _sample_user_ids(activity_df, *, users_df, active_user_counts,
-                     start_date, end_date, seed=None):
-    df = activity_df.copy()
-
-    # on avg, uuid digits sum near 100 and give norm dist
-    sum_of_user_id_digits = [sum(i)
-                             for i in [[int(i) for i in ''.join(s)]
-                                       for s in (users_df.index
-                                                 .str.findall("(\d*\.?\d+)"))]]
-    # make stickiness score from UUID (positive skew)
-    stickiness_score = (pd.Series(sum_of_user_id_digits,
-                                  index=users_df.index) ** 2 // 100)
-
-    for d in pd.date_range(start_date, end_date, closed='left'):
-        list_active_users_to_add = []
-
-        dau = active_user_counts.loc[d]
-
-        filtered_df = users_df[users_df['activation_date'] <= d].copy()
-        filtered_df['days_since_activation'] = (d - filtered_df['activation_date']).dt.days
-
-        new_users = np.unique(filtered_df[filtered_df['days_since_activation'] == 0]
-                              .index.tolist())
+        seed=seed, rng=rng)
+    return _get_session_dataset(active_user_counts, users_df=users_df,
+                                seed=seed, rng=rng, sampler=sampler,
+                                stickiness_decay=stickiness_decay,
+                                engine=engine,
+                                include_user_columns=include_user_columns,
+                                n_jobs=n_jobs, executor=executor,
+                                max_memory_bytes=max_memory_bytes,
+                                spill_dir=spill_dir)
+
+
+def _get_session_dataset(active_user_counts, *, users_df,
+                         max_memory_bytes=None, spill_dir=None, n_jobs=None,
+                         executor=None, **kwargs):
+    """Return the session dataset for a given trajectory of DAU counts,
+    within max_memory_bytes if given (see get_session_dataset)."""
+    if max_memory_bytes is not None:
+        return _build_session_dataset_within_budget(
+            active_user_counts, users_df=users_df,
+            max_memory_bytes=max_memory_bytes, spill_dir=spill_dir,
+            **kwargs)
+    return _build_session_dataset(active_user_counts, users_df=users_df,
+                                  n_jobs=n_jobs, executor=executor,
+                                  **kwargs)
+
+
+def _build_session_dataset(active_user_counts, *, users_df,
+                           seed=None, rng=None, sampler='choice',
+                           stickiness_decay=None, engine='numpy',
+                           include_user_columns=None, n_jobs=None,
+                           executor=None):
+    """Return the session dataset for a given trajectory of DAU counts."""
+    # sessions of each date are one contiguous block (dates in order), at
+    # [session_offsets[i], session_offsets[i + 1])
+    session_counts = active_user_counts.values.astype(np.int64)
+    session_offsets = np.concatenate([[0], session_counts.cumsum()])
+
+    # choose active users (rows of users_df) via a sampling function
+    user_rows = _sample_user_rows(users_df=users_df,
+                                  active_user_counts=active_user_counts,
+                                  session_offsets=session_offsets,
+                                  seed=seed, rng=rng,
+                                  sampler=sampler,
+                                  stickiness_decay=stickiness_decay,
+                                  engine=engine,
+                                  n_jobs=n_jobs,
+                                  executor=executor)
+
+    id_names = _get_session_id_names(users_df)
+    sessions = _get_session_columns(
+        id_names[0],
+        _get_session_ids(session_offsets[-1], users_df=users_df,
+                         rng=_get_stream_rng('session_id', seed, rng)),
+        user_rows,
+        np.repeat(active_user_counts.index.values, session_counts),
+        user_columns=_get_user_columns(
+            users_df, include_user_columns=include_user_columns))
+    return pd.DataFrame(sessions).set_index(id_names[0])
+
+
+def _build_session_dataset_within_budget(active_user_counts, *, users_df,
+                                         max_memory_bytes, spill_dir=None,
+                                         include_user_columns=None,
+                                         **kwargs):
+    """Return the session dataset (as _build_session_dataset) generated in
+    batches of dates (see _iter_session_batches) into preallocated columns,
+    to stay within max_memory_bytes, with its peak RSS and memory plan in
+    its attrs."""
+    with track_peak_rss() as tracker:
+        id_names = _get_session_id_names(users_df)
+        # empty session columns, for the names and dtypes
+        template = _get_session_columns(
+            id_names[0],
+            _get_session_ids(0, users_df=users_df),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype='datetime64[ns]'),
+            user_columns=_get_user_columns(
+                users_df, include_user_columns=include_user_columns,
+                categorical=True))
+        dtypes = {name: (values.codes.dtype
+                         if isinstance(values, pd.Categorical)
+                         else values.dtype)
+                  for name, values in template.items()}
+        # the UUID session IDs are new strings, the user IDs are shared
+        row_bytes = (sum(dtype.itemsize for dtype in dtypes.values())
+                     + (_UUID_STR_BYTES if dtypes[id_names[0]] == object
+                        else 0))
+        plan = _get_session_memory_plan(
+            active_user_counts, n_users=len(users_df), row_bytes=row_bytes,
+            spillable=object not in dtypes.values(),
+            available_bytes=max_memory_bytes - get_rss_bytes())
+
+        n_sessions = int(active_user_counts.values.astype(np.int64).sum())
+        if plan.spill:
+            spill_path = tempfile.mkdtemp(prefix='sessions-', dir=spill_dir)
+            files = {name: open(os.path.join(spill_path, '{}.bin'.format(i)),
+                                'wb')
+                     for i, name in enumerate(dtypes)}
+        else:
+            columns = {name: np.empty(n_sessions, dtype=dtype)
+                       for name, dtype in dtypes.items()}
+
+        start = 0
+        try:
+            for batch in _iter_session_batches(
+                    active_user_counts, users_df=users_df,
+                    include_user_columns=include_user_columns,
+                    freq=plan.batch_freq, as_dict=True,
+                    categorical_user_columns=True, **kwargs):
+                end = start + len(batch[id_names[0]])
+                for name, values in batch.items():
+                    if isinstance(values, pd.Categorical):
+                        values = values.codes
+                    if plan.spill:
+                        values.tofile(files[name])
+                    else:
+                        columns[name][start:end] = values
+                start = end
+        finally:
+            if plan.spill:
+                for file in files.values():
+                    file.close()
+
+        if plan.spill:
+            # the mappings keep the data of the removed files (on POSIX)
+            columns = {name: (np.memmap(files[name].name, dtype=dtype,
+                                        mode='r', shape=(n_sessions,))
+                              if n_sessions else np.empty(0, dtype=dtype))
+                       for name, dtype in dtypes.items()}
+            shutil.rmtree(spill_path, ignore_errors=True)
+
+        for name, values in template.items():
+            if isinstance(values, pd.Categorical):
+                columns[name] = pd.Categorical.from_codes(columns[name],
+                                                          values.categories)
+        index = pd.Index(columns.pop(id_names[0]), name=id_names[0])
+        session_df = pd.DataFrame(columns, index=index, copy=False)
+
+    session_df.attrs['peak_rss_bytes'] = tracker.peak_rss_bytes
+    session_df.attrs['memory_plan'] = plan
+    return session_df
+
+
+def _get_session_memory_plan(active_user_counts, *, n_users, row_bytes,
+                             spillable, available_bytes):
+    """Return the plan (period of the batches of dates, whether to spill
+    the session columns to disk, estimated peak bytes) to generate the
+    sessions within available_bytes, given the bytes per session row.
+
+    The user pool and one batch need to fit, and the session columns too
+    unless they're spilled.  The largest batches that fit are used, as
+    small batches have more overhead per session.
+    """
+    session_counts = active_user_counts.astype(np.int64)
+    result_bytes = int(session_counts.sum()) * row_bytes
+    pool_bytes = n_users * _POOL_BYTES_PER_USER
+    spill = pool_bytes + result_bytes > available_bytes
+    if spill and not spillable:
+        raise MemoryError(
+            'Session dataset needs about {} bytes in memory, but only {} '
+            'bytes of the budget are free, and its UUID session IDs cannot '
+            'be spilled to disk: use users with integer keys '
+            "(id_format='int')".format(pool_bytes + result_bytes,
+                                       max(available_bytes, 0)))
+
+    batch_bytes_left = available_bytes - pool_bytes - (0 if spill
+                                                        else result_bytes)
+    for freq in _BUDGET_BATCH_FREQS:
+        batch_sessions = (session_counts
+                          .groupby(session_counts.index.to_period(freq))
+                          .sum().max()) if len(session_counts) else 0
+        batch_bytes = int(batch_sessions) * (_BATCH_BYTES_PER_SESSION
+                                             + row_bytes)
+        if batch_bytes <= batch_bytes_left:
+            return _SessionMemoryPlan(
+                freq, spill,
+                pool_bytes + batch_bytes + (0 if spill else result_bytes))
+    raise MemoryError('Session dataset needs at least about {} bytes to '
+                      'generate, but only {} bytes of the budget are free'
+                      .format(available_bytes - batch_bytes_left
+                              + batch_bytes, max(available_bytes, 0)))
+
+
+def _get_session_id_names(users_df):
+    """Return names of the session and user ID columns of the sessions,
+    (session_key, user_key) if users_df has integer keys."""
+    if _is_int_id_format(users_df):
+        return 'session_key', 'user_key'
+    return 'session_id', 'user_id'
+
+
+def _get_session_columns(session_id_name, session_ids, user_rows,
+                         session_start_dates, *, user_columns):
+    """Return dict of the session columns: session ID, user ID, start date
+    and user columns, where the user ID and user columns (see
+    _get_user_columns) are gathered from the rows of the active users."""
+    user_values = [(name, values[user_rows])
+                   for name, values in user_columns.items()]
+    return dict([(session_id_name, session_ids), user_values[0],
+                 ('session_start_date', session_start_dates),
+                 *user_values[1:]])
+
+
+def _get_user_columns(users_df, *, include_user_columns=None,
+                      categorical=False):
+    """Return dict of the user ID (user_id, or user_key with integer keys)
+    and the include_user_columns (prefixed with 'user_') of users_df, as
+    arrays in the order of the rows of users_df.  With categorical=True,
+    object (string) columns are returned as pd.Categorical."""
+    if _is_int_id_format(users_df):
+        user_columns = {'user_key': users_df.index.values.astype(
+            _get_key_dtype(len(users_df)))}
+    else:
+        user_columns = {'user_id': users_df.index.values}
+    for name in include_user_columns or []:
+        values = users_df[name].values
+        if categorical and values.dtype == object:
+            values = pd.Categorical(values)
+        user_columns['user_{}'.format(name)] = values
+    return user_columns
+
+
+def _get_session_ids(n, *, users_df, key_start=0, rng=None):
+    """Return n session IDs: UUID strings drawn from rng, or integer keys
+    from key_start if users_df has integer keys."""
+    if _is_int_id_format(users_df):
+        return np.arange(key_start, key_start + n, dtype=np.int64)
+    return _get_uuid_values(n, rng=rng)
+
+
+def _sample_user_rows(*, users_df, active_user_counts, session_offsets,
+                      seed=None, rng=None, sampler='choice',
+                      stickiness_decay=None, engine='numpy', n_jobs=None,
+                      executor=None):
+    """Return array of the rows (positions in users_df) of the active users
+    for all sessions, where the sessions of date i are at
+    [session_offsets[i], session_offsets[i + 1]).
+    """
+    engine = _get_engine(engine)
+    use_shards = executor is not None or (n_jobs is not None and n_jobs != 1)
+    if engine == 'numba' and use_shards:
+        # the kernel runs on all cores already, and its threads don't mix
+        # with the threads or forks of an executor
+        raise ValueError("n_jobs and executor are not supported with "
+                         "engine='numba', which is multi-threaded")
+    date_days = (active_user_counts.index.values
+                 .astype('datetime64[D]').astype(np.int64))
+    session_counts = np.diff(session_offsets)
+    user_rows, activation_days, score_weights, decay_weights = _get_user_pool(
+        users_df, date_days=date_days, stickiness_decay=stickiness_decay)
+    date_seeds, bit_generator = _get_date_streams(len(date_days),
+                                                  seed=seed, rng=rng)
+
+    if not use_shards:
+        positions = _sample_user_positions(activation_days=activation_days,
+                                           score_weights=score_weights,
+                                           decay_weights=decay_weights,
+                                           date_days=date_days,
+                                           session_counts=session_counts,
+                                           date_seeds=date_seeds,
+                                           bit_generator=bit_generator,
+                                           sampler=sampler,
+                                           engine=engine)
+    else:
+        positions = _sample_user_positions_in_shards(
+            activation_days=activation_days,
+            score_weights=score_weights,
+            decay_weights=decay_weights,
+            date_days=date_days,
+            session_counts=session_counts,
+            date_seeds=date_seeds,
+            bit_generator=bit_generator,
+            sampler=sampler,
+            engine=engine,
+            n_jobs=n_jobs,
+            executor=executor)
+    return user_rows[positions]
+
+
+def _get_user_pool(users_df, *, date_days, stickiness_decay=None):
+    """Return user rows (positions in users_df), activation days and the
+    parts of the stickiness weights (fixed per user, and lookup by days
+    since activation) for the sampling of the active users on date_days.
+
+    The users are sorted by activation date, so the users eligible on a
+    date are a prefix of the arrays, which grows day by day.
+    """
+    if _is_int_id_format(users_df):
+        stickiness_score = _get_raw_id_stickiness_scores(
+            np.column_stack([users_df['uuid_hi'].values,
+                             users_df['uuid_lo'].values]))
+    else:
+        stickiness_score = _get_stickiness_scores(users_df.index).values
+
+    activation_days = users_df['activation_date'].values.astype('datetime64[D]')
+    order = np.argsort(activation_days, kind='stable')
+    activation_days = activation_days[order].astype(np.int64)
+    # UUID part of the weights is fixed per user, so compute it once
+    score_weights = 0.2 * stickiness_score[order]
+
+    # decay part of the weights only depends on days since activation
+    decay_weights = _get_stickiness_decay_weights(
+        date_days[-1] - activation_days[0] + 1 if len(date_days) else 1,
+        stickiness_decay=stickiness_decay)
+    return order, activation_days, score_weights, decay_weights
+
+
+def _get_engine(engine):
+    """Return the engine to sample the sessions with ('numba' only if
+    numba is installed)."""
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}, got '{}'"
+                         .format(ENGINES, engine))
+    if engine == 'numba' and get_sample_user_positions_kernel() is None:
+        warnings.warn("numba is not installed, using engine='numpy'")
+        return 'numpy'
+    return engine
+
+
+def _get_date_streams(n_dates, *, seed=None, rng=None):
+    """Return seed sequences and bit generator for an independent random
+    stream per date, so that the draws for a date do not depend on how the
+    date range is split up (e.g. between workers or into batches).  The
+    bit generator of rng (e.g. SFC64) is used if given."""
+    date_seeds = _get_seed_sequence(seed, rng).spawn(n_dates)
+    bit_generator = (type(rng.bit_generator)
+                     if isinstance(rng, np.random.Generator)
+                     else np.random.PCG64)
+    return date_seeds, bit_generator
+
+
+def _sample_user_positions_in_shards(*, activation_days, score_weights,
+                                     date_days, session_counts, date_seeds,
+                                     n_jobs=None, executor=None, **kwargs):
+    """Run _sample_user_positions on contiguous shards of the date range in
+    a process pool, then concatenate the shards (in date order)."""
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    # more shards than workers, as later dates have larger user pools
+    date_shards = np.array_split(np.arange(len(date_days)),
+                                 min(len(date_days), 4 * n_jobs))
+
+    own_executor = executor is None
+    if own_executor:
+        # imported here, as multiprocessing is slow to import
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # workers are not forked from this process, which may have threads
+        # running (e.g. of Numba), so forked workers could deadlock
+        start_method = ('forkserver' if 'forkserver'
+                        in multiprocessing.get_all_start_methods()
+                        else 'spawn')
+        executor = ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context(start_method))
+    try:
+        futures = []
+        for shard in date_shards:
+            # shard only needs the users activated by its last date
+            pool_end = np.searchsorted(activation_days, date_days[shard[-1]],
+                                       side='right')
+            futures.append(executor.submit(
+                _sample_user_positions,
+                activation_days=activation_days[:pool_end],
+                score_weights=score_weights[:pool_end],
+                date_days=date_days[shard],
+                session_counts=session_counts[shard],
+                date_seeds=[date_seeds[i] for i in shard],
+                **kwargs))
+        positions = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return np.concatenate(positions)
+
+
+def _sample_user_positions(*, activation_days, score_weights, decay_weights,
+                           date_days, session_counts, date_seeds,
+                           bit_generator=np.random.PCG64, sampler='choice',
+                           engine='numpy'):
+    """Return positions of the active users (in the user arrays sorted by
+    activation date) for the sessions of each date in date_days, in date
+    order.  Each date draws from its own stream from date_seeds.
+    """
+    if engine == 'numba':
+        kernel = get_sample_user_positions_kernel()
+        return kernel(activation_days, score_weights, decay_weights,
+                      date_days, session_counts.astype(np.int64),
+                      np.array([date_seed.generate_state(1, np.uint64)[0]
+                                for date_seed in date_seeds],
+                               dtype=np.uint64))
+
+    # per date: [new_user_starts, new_user_ends) are the users activated on
+    # that date, [0, new_user_starts) are the existing users
+    new_user_starts = np.searchsorted(activation_days, date_days, side='left')
+    new_user_ends = np.searchsorted(activation_days, date_days, side='right')
+
+    positions = np.empty(session_counts.sum(), dtype=np.int64)
+    block_start = 0
+    for i in range(len(date_days)):
+        rng = np.random.Generator(bit_generator(date_seeds[i]))
+        n_existing = new_user_starts[i]
 
         # make all new users active for this day
-        list_active_users_to_add.extend(new_users)
+        new_users = np.arange(n_existing, new_user_ends[i])
 
         # for remaining active users to fill, use a sampling function
-        active_users_left_to_add = dau - len(new_users)
+        active_users_left_to_add = session_counts[i] - len(new_users)
 
-        active_existing_user_ids = _draw_existing_users_to_set_as_active(
-            filtered_df,
-            stickiness_score=stickiness_score,
-            n_draws=active_users_left_to_add
+        active_existing_users = _draw_existing_users_to_set_as_active(
+            score_weights=score_weights[:n_existing],
+            decay_weights=decay_weights,
+            days_since_activation=date_days[i] - activation_days[:n_existing],
+            n_draws=active_users_left_to_add,
+            sampler=sampler,
+            rng=rng
         )
 
-        list_active_users_to_add.extend(active_existing_user_ids)
+        # set users (new users first) in the date's block of sessions
+        block_mid = block_start + len(new_users)
+        block_end = block_start + session_counts[i]
+        positions[block_start:block_mid] = new_users
+        positions[block_mid:block_end] = active_existing_users
+        block_start = block_end
 
-        # set user ids
-        df.loc[df['session_start_date'] == d,
-               'user_id'] = list_active_users_to_add
+    return positions
 
-    return (df
-            .merge(users_df['activation_date'].rename('user_activation_date'),
-                   how='left', left_on=['user_id'], right_index=True))
 
+def _get_stickiness_scores(user_ids):
+    """Return stickiness score of each user ID (positive skew), indexed by
+    user ID.
+
+    The score is (sum of the decimal digits in the ID) ** 2 // 100.  On avg,
+    uuid digits sum near 100 and give norm dist.  The digits are summed on
+    a fixed-width uint8 array of the ID characters, rather than per string.
+    """
+    user_ids = pd.Index(user_ids)
+    # fixed-width bytes: one row of character codes per ID (null padded)
+    id_chars = np.asarray(user_ids, dtype=bytes)
+    id_chars = (id_chars.view(np.uint8)
+                .reshape(len(id_chars), id_chars.dtype.itemsize))
+
+    # non-digit characters wrap around to values >= 10 after the subtraction
+    digit_values = id_chars - np.uint8(ord('0'))
+    sum_of_user_id_digits = np.where(digit_values < 10, digit_values,
+                                     0).sum(axis=1, dtype=np.int64)
+    return pd.Series(sum_of_user_id_digits, index=user_ids) ** 2 // 100
+
+
+def _get_raw_id_stickiness_scores(raw_ids):
+    """Return array of the stickiness scores (see _get_stickiness_scores)
+    of the users with the given (n, 2) uint64 array of 128-bit IDs.
+
+    The decimal digits of a UUID string are its hex digits (4-bit nibbles)
+    under 10, so the scores are computed from the nibbles with no strings.
+    """
+    id_bytes = raw_ids.astype('>u8').view(np.uint8).reshape(-1, 16)
+    nibbles = np.concatenate([id_bytes >> 4, id_bytes & 0x0f], axis=1)
+    sum_of_user_id_digits = np.where(nibbles < 10, nibbles,
+                                     0).sum(axis=1, dtype=np.int64)
+    return sum_of_user_id_digits ** 2 // 100
 
-def _draw_existing_users_to_set_as_active(existing_users_df, *, stickiness_score, n_draws):
-    filtered_df = existing_users_df[existing_users_df['days_since_activation'] > 0].copy()
-    existing_users = np.unique(filtered_df.index.tolist())
 
-    # get weights for users who were created before date (inclusive) (sum to 1)
-    stickiness_weights = stickiness_score.filter(existing_users, axis=0)
+def _get_stickiness_decay_weights(n_days, *, stickiness_decay=None):
+    """Return lookup table of the decay part of the stickiness weights,
+    indexed by days since activation (0 to n_days - 1)."""
+    params = dict(STICKINESS_DECAY_PARAMS)
+    unknown_params = set(stickiness_decay or {}) - set(params)
+    if unknown_params:
+        raise ValueError('Unknown stickiness_decay params: {}'
+                         .format(sorted(unknown_params)))
+    params.update(stickiness_decay or {})
 
+    days_since_activation = np.arange(max(n_days, 1))
     # decay function (horizontal asymptote to encourage an engagement floor)
-    filtered_df['stickiness_decay_factor'] = 0.8 * 0.9 ** filtered_df['days_since_activation'] + 0.1
+    stickiness_decay_factor = (params['amplitude']
+                               * params['rate'] ** days_since_activation
+                               + params['floor'])
+    return 0.8 * (params['scale'] * stickiness_decay_factor)
+
 
-    # weighted function (of sticky user IDs and of time since activation )
-    stickiness_weights = 0.2 * stickiness_weights + 0.8 * (40 * filtered_df['stickiness_decay_factor'])
-    # sum weights to 1 before doing the sampling
-    stickiness_weights = stickiness_weights / stickiness_weights.sum()
+def _draw_existing_users_to_set_as_active(*, score_weights, decay_weights,
+                                          days_since_activation, n_draws,
+                                          sampler='choice', rng=None):
+    """Sample n_draws of the existing users (activated before the date),
+    returning their positions in the pool of existing users.
+
+    All per-user inputs are aligned NumPy arrays for the pool of existing
+    users, so no filtering or index alignment is needed per date.
+    """
+    # weighted function (of sticky user IDs and of time since activation)
+    stickiness_weights = score_weights + decay_weights[days_since_activation]
 
     # sample active users via stickiness weights (sample -> no replacement)
-    active_existing_user_ids = np.random.choice(stickiness_weights.index.tolist(),
-                                                size=n_draws,
-                                                replace=False,
-                                                p=stickiness_weights.tolist())
-    return active_existing_user_ids
+    return sample_without_replacement(stickiness_weights, n_draws,
+                                      sampler=sampler, rng=rng)
@@ -0,0 +1,119 @@
+from functools import cached_property
+
+import numpy as np
+
+from src._user_growth import (get_user_counts_by_date, _get_active_user_p_by_date,
+                              _get_active_user_counts, _get_seed_sequence)
+from src.data import (_get_new_user_counts, _build_user_dataset,
+                      _get_session_dataset)
+
+
+class Simulation:
+    """Simulation of a SaaS business, given these parameters:
+    - Date range
+    - approx_yoy_growth_rate of users (people who have signed up in total)
+    - start_users (number of users on start date)
+
+    The user count and DAU trajectories are computed lazily, exactly once,
+    and shared by the user and session datasets, so the datasets always
+    line up (whether seeded or not).
+
+    With seed, the values are the same as from the functions in
+    src._user_growth and src.data for that seed.  With rng, each part of
+    the simulation (user counts, DAU %, users, sessions) draws from its own
+    stream spawned from rng, so the values do not depend on the order the
+    attributes are accessed in.
+
+    Args:
+        start_date (str): Y-m-d date string for the start of the series.
+        end_date (str): Y-m-d date string for the end of the series.
+        approx_yoy_growth_rate (int, optional): YoY growth rate for the
+            user count (>=1), e.g. 2 for +100%, 3 for +200%. Defaults to 3.
+        start_users (int, optional): Number of users at the start date.
+            Defaults to 10000.
+        seed (int, optional): Random seed. Defaults to None.
+        rng (np.random.Generator, optional): random generator to draw from
+            instead of seed. Defaults to None.
+        id_format (str, optional): 'uuid' or 'int' (dense integer user
+            and session keys, see get_user_dataset).  Defaults to 'uuid'.
+        session_options (dict, optional): other keyword arguments for the
+            session dataset, e.g. sampler, n_jobs (see get_session_dataset).
+            Defaults to None.
+
+    Example:
+        >>> sim = Simulation('2019-01-01', '2020-01-01', seed=100)
+        >>> sim.dau  # DAU counts by date
+        >>> sim.users  # user dataset
+        >>> sim.sessions  # session dataset
+    """
+    _STREAMS = ('user_counts', 'active_user_p', 'users', 'sessions')
+
+    def __init__(self, start_date, end_date, *,
+                 approx_yoy_growth_rate=3, start_users=10000,
+                 seed=None, rng=None, id_format='uuid',
+                 session_options=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.approx_yoy_growth_rate = approx_yoy_growth_rate
+        self.start_users = start_users
+        self.seed = seed
+        self.id_format = id_format
+        self.session_options = dict(session_options or {})
+
+        if seed is None:
+            if rng is None:
+                rng = np.random.default_rng()
+            bit_generator = (type(rng.bit_generator)
+                             if isinstance(rng, np.random.Generator)
+                             else np.random.PCG64)
+            stream_seeds = (_get_seed_sequence(rng=rng)
+                            .spawn(len(self._STREAMS)))
+            self._rngs = {name: np.random.Generator(bit_generator(stream_seed))
+                          for name, stream_seed
+                          in zip(self._STREAMS, stream_seeds)}
+        else:
+            self._rngs = dict.fromkeys(self._STREAMS)
+
+    def __repr__(self):
+        return ('Simulation({!r}, {!r}, approx_yoy_growth_rate={!r}, '
+                'start_users={!r}, seed={!r})'
+                .format(self.start_date, self.end_date,
+                        self.approx_yoy_growth_rate, self.start_users,
+                        self.seed))
+
+    @cached_property
+    def user_counts(self):
+        """pd.Series: count of users by date."""
+        return get_user_counts_by_date(
+            self.start_date, self.end_date,
+            approx_yoy_growth_rate=self.approx_yoy_growth_rate,
+            start_users=self.start_users,
+            seed=self.seed, rng=self._rngs['user_counts'])
+
+    @cached_property
+    def active_user_p(self):
+        """pd.Series: % of users active by date."""
+        return _get_active_user_p_by_date(self.start_date, self.end_date,
+                                          seed=self.seed,
+                                          rng=self._rngs['active_user_p'])
+
+    @cached_property
+    def dau(self):
+        """pd.Series: count of daily active users (DAU) by date."""
+        return _get_active_user_counts(self.user_counts, self.active_user_p)
+
+    @cached_property
+    def users(self):
+        """pd.DataFrame: user dataset (see get_user_dataset)."""
+        return _build_user_dataset(_get_new_user_counts(self.user_counts),
+                                   start_users=self.start_users,
+                                   seed=self.seed, rng=self._rngs['users'],
+                                   id_format=self.id_format)
+
+    @cached_property
+    def sessions(self):
+        """pd.DataFrame: session dataset (see get_session_dataset)."""
+        return _get_session_dataset(self.dau, users_df=self.users,
+                                    seed=self.seed,
+                                    rng=self._rngs['sessions'],
+                                    **self.session_options)
@@ -0,0 +1,293 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data import (get_user_dataset, iter_user_batches,
+                      iter_session_batches)
+
+
+# rows per Parquet row group (large row groups make for fast scans)
+ROW_GROUP_SIZE = 1_000_000
+
+FORMATS = ('parquet', 'csv', 'csv.gz')
+
+# what to do with the existing files of a partition that is written to:
+# raise FileExistsError, add more part files, or replace them
+WRITE_MODES = ('error', 'append', 'overwrite')
+
+# Hive-style partition keys (directory levels) for each partition_freq
+PARTITION_KEYS = {'Y': ('year',),
+                  'M': ('year', 'month'),
+                  'D': ('year', 'month', 'day')}
+
+
+def write_session_dataset(path, start_date, end_date, *, users_df,
+                          file_format=None, partition_freq='D',
+                          row_group_size=ROW_GROUP_SIZE, mode='error',
+                          **kwargs):
+    """Generate the session dataset and stream it to disk as a Hive-style
+    dataset partitioned by session_start_date, e.g.
+    path/year=2019/month=1/day=1/part-0.parquet, one batch of dates at a
+    time (see iter_session_batches), so datasets larger than memory can be
+    written.
+
+    Args:
+        path (str): directory to write the dataset to.
+        start_date (str): Y-m-d date string for the start of the series.
+        end_date (str): Y-m-d date string for the end of the series.
+        users_df (pd.DataFrame): user data to utilise in the data
+            generation process for this session-level dataset.
+        file_format (str, optional): 'parquet' (needs pyarrow), 'csv' or
+            'csv.gz'.  Defaults to None ('parquet' if pyarrow is installed,
+            else 'csv.gz').
+        partition_freq (str, optional): partition per 'Y' (year),
+            'M' (month) or 'D' (day).  Defaults to 'D'.
+        row_group_size (int, optional): rows per Parquet row group.
+            Defaults to ROW_GROUP_SIZE.
+        mode (str, optional): if a partition has files already, 'error'
+            to raise FileExistsError, 'append' to add a part file, or
+            'overwrite' to replace its files.  Defaults to 'error'.
+        **kwargs: other arguments of iter_session_batches, e.g. seed.
+
+    Returns:
+        list of the paths of the files written
+    """
+    batches = iter_session_batches(start_date, end_date, users_df=users_df,
+                                   freq=partition_freq, as_dict=True,
+                                   **kwargs)
+    return write_dataset_batches(batches, path,
+                                 partition_col='session_start_date',
+                                 partition_freq=partition_freq,
+                                 file_format=file_format,
+                                 row_group_size=row_group_size, mode=mode)
+
+
+def write_user_dataset(path, start_date, end_date, *, file_format=None,
+                       partition_freq='M', row_group_size=ROW_GROUP_SIZE,
+                       chunk_size=None, mode='error', **kwargs):
+    """Generate the user dataset and write it to disk as a Hive-style
+    dataset partitioned by activation date, e.g.
+    path/year=2019/month=1/part-0.parquet.
+
+    With chunk_size, the users are generated and written a chunk at a time
+    (see iter_user_batches), so datasets larger than memory can be written.
+    The files are the same either way.
+
+    Args:
+        path (str): directory to write the dataset to.
+        start_date (str): Y-m-d date string for the start of the series.
+        end_date (str): Y-m-d date string for the end of the series.
+        file_format (str, optional): 'parquet' (needs pyarrow), 'csv' or
+            'csv.gz'.  Defaults to None ('parquet' if pyarrow is installed,
+            else 'csv.gz').
+        partition_freq (str, optional): partition per 'Y' (year),
+            'M' (month) or 'D' (day).  Defaults to 'M'.
+        row_group_size (int, optional): rows per Parquet row group.
+            Defaults to ROW_GROUP_SIZE.
+        chunk_size (int, optional): users per batch to generate at a time.
+            Defaults to None (generate the whole dataset at once).
+        mode (str, optional): 'error', 'append' or 'overwrite' (see
+            write_session_dataset).  Defaults to 'error'.
+        **kwargs: other arguments of get_user_dataset (or of
+            iter_user_batches, with chunk_size), e.g. seed.
+
+    Returns:
+        list of the paths of the files written
+    """
+    if chunk_size is not None:
+        batches = iter_user_batches(start_date, end_date,
+                                    chunk_size=chunk_size, as_dict=True,
+                                    **kwargs)
+    else:
+        users_df = (get_user_dataset(start_date, end_date, **kwargs)
+                    .sort_values('activation_date', kind='stable'))
+        batches = _iter_frame_batches(users_df, 'activation_date',
+                                      partition_freq)
+    return write_dataset_batches(
+        batches, path, partition_col='activation_date',
+        partition_freq=partition_freq, file_format=file_format,
+        row_group_size=row_group_size, mode=mode)
+
+
+def write_dataset_batches(batches, path, *, partition_col, partition_freq='D',
+                          file_format=None, row_group_size=ROW_GROUP_SIZE,
+                          mode='error'):
+    """Write batches of rows (DataFrames or dicts of arrays), sorted by
+    partition_col, as a Hive-style partitioned dataset: a directory per
+    period of partition_col, e.g. path/year=2019/month=1 for
+    partition_freq='M' (see PARTITION_KEYS).
+
+    Batches are written as they come, so only one batch (and, for Parquet,
+    one row group) is held in memory at a time.  Partitions that already
+    have files are handled by mode (see WRITE_MODES): with 'append', each
+    write adds a part-N file, so re-running it duplicates the rows.
+
+    Returns:
+        list of the paths of the files written
+    """
+    file_format = _get_file_format(file_format)
+    if partition_freq not in PARTITION_KEYS:
+        raise ValueError("partition_freq must be one of {}, got '{}'"
+                         .format(tuple(PARTITION_KEYS), partition_freq))
+    if mode not in WRITE_MODES:
+        raise ValueError("mode must be one of {}, got '{}'"
+                         .format(WRITE_MODES, mode))
+    partition_keys = PARTITION_KEYS[partition_freq]
+    writer = None
+    partition = None
+    paths = []
+    try:
+        for batch in batches:
+            batch = _to_columns(batch)
+            periods = (pd.DatetimeIndex(batch[partition_col])
+                       .to_period(partition_freq))
+            # split the batch where its partition changes (in case a batch
+            # has more than one)
+            splits = np.flatnonzero(periods[1:] != periods[:-1]) + 1
+            for rows in np.split(np.arange(len(periods)), splits):
+                if not len(rows):
+                    continue
+                if periods[rows[0]] != partition:
+                    if writer is not None:
+                        writer.close()
+                    partition = periods[rows[0]]
+                    partition_dir = os.path.join(
+                        path, *['{}={}'.format(key, getattr(partition, key))
+                                for key in partition_keys])
+                    _prepare_partition_dir(partition_dir, mode)
+                    writer = _get_writer(partition_dir, file_format,
+                                         row_group_size=row_group_size)
+                    paths.append(writer.path)
+                writer.write({name: values[rows[0]:rows[-1] + 1]
+                              for name, values in batch.items()})
+    finally:
+        if writer is not None:
+            writer.close()
+    return paths
+
+
+def _iter_frame_batches(df, partition_col, partition_freq):
+    periods = df[partition_col].dt.to_period(partition_freq)
+    for _, batch in df.groupby(periods.values, sort=False):
+        yield batch
+
+
+def _to_columns(batch):
+    """Return dict of column arrays of a batch (index included)."""
+    if isinstance(batch, pd.DataFrame):
+        batch = batch.reset_index()
+        return {name: batch[name].values for name in batch.columns}
+    return batch
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _get_file_format(file_format):
+    if file_format is None:
+        return 'parquet' if _import_pyarrow() is not None else 'csv.gz'
+    if file_format not in FORMATS:
+        raise ValueError("file_format must be one of {}, got '{}'"
+                         .format(FORMATS, file_format))
+    if file_format == 'parquet' and _import_pyarrow() is None:
+        raise ImportError("file_format='parquet' requires pyarrow")
+    return file_format
+
+
+def _get_part_files(partition_dir):
+    if not os.path.isdir(partition_dir):
+        return []
+    return [name for name in os.listdir(partition_dir)
+            if name.startswith('part-')]
+
+
+def _prepare_partition_dir(partition_dir, mode):
+    """Check or remove the existing part files of a partition, for mode."""
+    part_files = _get_part_files(partition_dir)
+    if not part_files or mode == 'append':
+        return
+    if mode == 'error':
+        raise FileExistsError(
+            "partition {} has files already, pass mode='append' or "
+            "'overwrite'".format(partition_dir))
+    for name in part_files:
+        os.remove(os.path.join(partition_dir, name))
+
+
+def _get_writer(partition_dir, file_format, *, row_group_size):
+    os.makedirs(partition_dir, exist_ok=True)
+    # next free part number (partitions may be written in several runs)
+    part = len(_get_part_files(partition_dir))
+    path = os.path.join(partition_dir,
+                        'part-{}.{}'.format(part, file_format))
+    if file_format == 'parquet':
+        return _ParquetWriter(path, row_group_size=row_group_size)
+    return _CSVWriter(path, compress=file_format == 'csv.gz')
+
+
+class _ParquetWriter:
+    """Write columns to a Parquet file, buffering them into row groups of
+    row_group_size rows."""
+
+    def __init__(self, path, *, row_group_size):
+        self.path = path
+        self.row_group_size = row_group_size
+        self._pyarrow = _import_pyarrow()
+        self._writer = None
+        self._buffer = []
+        self._n_buffered = 0
+
+    def write(self, columns):
+        self._buffer.append(self._pyarrow.table(columns))
+        self._n_buffered += len(self._buffer[-1])
+        if self._n_buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self, *, final=False):
+        """Write the buffered rows as row groups of row_group_size rows,
+        keeping the remainder buffered (unless final)."""
+        if not self._buffer:
+            return
+        table = self._pyarrow.concat_tables(self._buffer)
+        n_rows = (len(table) if final
+                  else len(table) // self.row_group_size * self.row_group_size)
+        if n_rows:
+            if self._writer is None:
+                self._writer = self._pyarrow.parquet.ParquetWriter(
+                    self.path, table.schema)
+            self._writer.write_table(table.slice(0, n_rows),
+                                     row_group_size=self.row_group_size)
+        remainder = table.slice(n_rows)
+        self._buffer = [remainder] if len(remainder) else []
+        self._n_buffered = len(remainder)
+
+    def close(self):
+        self._flush(final=True)
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _CSVWriter:
+    """Write columns to a (gzip) CSV file, with a header row."""
+
+    def __init__(self, path, *, compress=False):
+        self.path = path
+        self._file = (gzip.open(path, 'wt', newline='', compresslevel=1)
+                      if compress else open(path, 'w', newline=''))
+        self._header = True
+
+    def write(self, columns):
+        pd.DataFrame(columns).to_csv(self._file, header=self._header,
+                                     index=False, date_format='%Y-%m-%d')
+        self._header = False
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+from pandas.testing import assert_series_equal, assert_frame_equal
+
+from src._cache import enable_cache, disable_cache, cache_info
+from src._user_growth import get_user_counts_by_date
+from src.data import get_user_dataset
+
+
+@pytest.fixture
+def cache():
+    enable_cache()
+    yield
+    disable_cache()
+
+
+def test_cache_seeded_calls_only(cache):
+    user_count_1 = get_user_counts_by_date('2019-01-01', '2020-01-01',
+                                           seed=100)
+    user_count_2 = get_user_counts_by_date('2019-01-01', '2020-01-01',
+                                           seed=100)
+    assert_series_equal(user_count_1, user_count_2)
+    assert cache_info().hits == 1 and cache_info().misses == 1
+
+    get_user_counts_by_date('2019-01-01', '2020-01-01')
+    get_user_counts_by_date('2019-01-01', '2020-01-01',
+                            rng=np.random.default_rng(100))
+    assert cache_info().n_items == 1
+
+
+def test_cache_returns_copies(cache):
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    expected = users_df.copy()
+    users_df['age'] = 0
+    assert_frame_equal(get_user_dataset('2019-01-01', '2019-02-01', seed=100),
+                       expected)
+
+
+def test_cache_evicts_least_recently_used():
+    # room for about two trajectories
+    enable_cache(max_bytes=12000)
+    try:
+        for seed in [1, 2, 1, 3]:
+            get_user_counts_by_date('2019-01-01', '2020-01-01', seed=seed)
+        info = cache_info()
+        assert info.hits == 1 and info.evictions == 1
+        assert info.size_bytes <= info.max_bytes
+        get_user_counts_by_date('2019-01-01', '2020-01-01', seed=1)
+        assert cache_info().hits == 2
+    finally:
+        disable_cache()
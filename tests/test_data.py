@@ -0,0 +1,301 @@
+import uuid
+import pytest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_series_equal, assert_frame_equal
+
+import src.data
+from src._memory import get_peak_rss_bytes
+from src._user_growth import (get_active_user_counts_by_date,
+                              get_user_counts_by_date,
+                              _get_active_user_counts,
+                              _get_active_user_p_by_date)
+from src.data import (get_user_dataset, get_session_dataset, iter_session_batches,
+                      iter_user_batches,
+                      get_user_ids, _get_activation_date_values,
+                      _get_age_dist_values, _get_user_country_values,
+                      _get_stickiness_decay_weights, _get_stickiness_scores,
+                      _get_uuid_values, _format_uuid_values)
+
+
+def test_uuid_values_seeded_uuid4():
+    user_ids = _get_uuid_values(1000, seed=100)
+    np.testing.assert_array_equal(user_ids, _get_uuid_values(1000, seed=100))
+    assert len(np.unique(user_ids)) == 1000
+    for user_id in user_ids:
+        assert str(uuid.UUID(user_id, version=4)) == user_id
+
+    raw_ids = _get_uuid_values(1000, seed=100, as_int=True)
+    assert raw_ids.shape == (1000, 2) and raw_ids.dtype == np.uint64
+    np.testing.assert_array_equal(_format_uuid_values(raw_ids), user_ids)
+
+
+def test_session_dataset_matches_dau():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                     users_df=users_df, seed=100)
+    dau_count = get_active_user_counts_by_date('2019-01-01', '2019-02-01',
+                                               seed=100)
+    sessions_by_date = session_df.groupby('session_start_date')['user_id']
+    assert_series_equal(sessions_by_date.size(), dau_count,
+                        check_names=False, check_freq=False)
+    # each active user has one session per date
+    assert_series_equal(sessions_by_date.nunique(), sessions_by_date.size())
+    assert session_df['user_id'].isin(users_df.index).all()
+
+
+def test_session_dataset_rng_matches_users():
+    # generators in the same state for the users and sessions (as in the
+    # docstring of get_session_dataset)
+    users_df = get_user_dataset('2019-01-01', '2019-04-01',
+                                rng=np.random.default_rng(100))
+    session_df = get_session_dataset('2019-01-01', '2019-04-01',
+                                     users_df=users_df,
+                                     rng=np.random.default_rng(100))
+    rng = np.random.default_rng(100)
+    user_counts = get_user_counts_by_date('2019-01-01', '2019-04-01', rng=rng)
+    active_user_p = _get_active_user_p_by_date('2019-01-01', '2019-04-01',
+                                               rng=rng)
+    # users_df has the users of these user counts
+    n_users = (users_df['activation_date'].values[:, None]
+               <= user_counts.index.values).sum(axis=0)
+    np.testing.assert_array_equal(n_users,
+                                  10000 + user_counts - user_counts.iloc[0])
+    # and the sessions are drawn with them
+    assert_series_equal(session_df.groupby('session_start_date').size(),
+                        _get_active_user_counts(user_counts, active_user_p),
+                        check_names=False, check_freq=False)
+
+
+def test_session_dataset_seeded():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    session_df_1 = get_session_dataset('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100)
+    session_df_2 = get_session_dataset('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100)
+    assert_frame_equal(session_df_1, session_df_2)
+
+
+def test_stickiness_scores_match_digit_regex():
+    user_ids = pd.Index([str(uuid.uuid4()) for i in range(1000)])
+    sum_of_user_id_digits = [sum(i)
+                             for i in [[int(i) for i in ''.join(s)]
+                                       for s in (user_ids
+                                                 .str.findall(r"(\d*\.?\d+)"))]]
+    expected = (pd.Series(sum_of_user_id_digits, index=user_ids)
+                ** 2 // 100)
+    assert_series_equal(_get_stickiness_scores(user_ids), expected)
+
+
+def test_stickiness_decay_weights_lookup():
+    days_since_activation = np.array([0, 1, 5, 30, 400])
+    decay_weights = _get_stickiness_decay_weights(500)
+    expected = 0.8 * (40 * (0.8 * 0.9 ** days_since_activation + 0.1))
+    np.testing.assert_allclose(decay_weights[days_since_activation], expected)
+
+    decay_weights = _get_stickiness_decay_weights(
+        500, stickiness_decay={'rate': 0.5, 'floor': 0.2})
+    expected = 0.8 * (40 * (0.8 * 0.5 ** days_since_activation + 0.2))
+    np.testing.assert_allclose(decay_weights[days_since_activation], expected)
+
+    with pytest.raises(ValueError):
+        _get_stickiness_decay_weights(500, stickiness_decay={'decay': 0.5})
+
+
+def test_session_dataset_same_for_any_n_jobs():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    session_df_1 = get_session_dataset('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100)
+    session_df_2 = get_session_dataset('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100,
+                                       n_jobs=2)
+    np.testing.assert_array_equal(session_df_1['user_id'].values,
+                                  session_df_2['user_id'].values)
+
+
+def test_session_batches_match_session_dataset():
+    users_df = get_user_dataset('2019-01-01', '2019-03-01', seed=100)
+    session_df = get_session_dataset('2019-01-01', '2019-03-01',
+                                     users_df=users_df, seed=100)
+    batches = list(iter_session_batches('2019-01-01', '2019-03-01',
+                                        users_df=users_df, seed=100,
+                                        freq='M'))
+    assert len(batches) == 2
+    assert_frame_equal(pd.concat(batches), session_df)
+
+    batch = next(iter_session_batches('2019-01-01', '2019-03-01',
+                                      users_df=users_df, seed=100,
+                                      as_dict=True))
+    np.testing.assert_array_equal(batch['session_id'],
+                                  session_df.index[:len(batch['session_id'])])
+
+
+def test_int_id_format_matches_uuids():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    int_users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100,
+                                    id_format='int')
+    assert int_users_df.index.name == 'user_key'
+    assert_frame_equal(int_users_df[users_df.columns].reset_index(drop=True),
+                       users_df.reset_index(drop=True))
+    np.testing.assert_array_equal(
+        get_user_ids(int_users_df.index, users_df=int_users_df),
+        users_df.index)
+
+    session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                     users_df=users_df, seed=100)
+    int_session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                         users_df=int_users_df, seed=100)
+    assert int_session_df.index.name == 'session_key'
+    assert int_session_df['user_key'].dtype == np.int32
+    np.testing.assert_array_equal(
+        get_user_ids(int_session_df['user_key'], users_df=int_users_df),
+        session_df['user_id'])
+    assert_frame_equal(
+        pd.concat(iter_session_batches('2019-01-01', '2019-02-01',
+                                       users_df=int_users_df, seed=100,
+                                       freq='W')),
+        int_session_df, check_index_type=False)
+
+
+def test_include_user_columns_matches_merge():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                     users_df=users_df, seed=100)
+    with_user_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100,
+                                       include_user_columns=['activation_date',
+                                                             'country'])
+    expected = session_df.merge(users_df[['activation_date', 'country']]
+                                .add_prefix('user_'),
+                                how='left', left_on='user_id',
+                                right_index=True)
+    assert_frame_equal(with_user_df, expected)
+    assert_frame_equal(
+        pd.concat(iter_session_batches('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100,
+                                       include_user_columns=['activation_date',
+                                                             'country'])),
+        expected)
+
+
+def test_session_dataset_within_memory_budget(monkeypatch, tmp_path):
+    # budget relative to an empty process, so the plan is deterministic
+    monkeypatch.setattr(src.data, 'get_rss_bytes', lambda: 0)
+    users_df = get_user_dataset('2019-01-01', '2019-07-01', seed=100,
+                                id_format='int')
+    session_df = get_session_dataset('2019-01-01', '2019-07-01',
+                                     users_df=users_df, seed=100,
+                                     include_user_columns=['country'])
+    expected = session_df.astype({'user_country': 'category'})
+
+    for max_memory_bytes, spill in [(2 ** 30, False), (2 ** 22, True)]:
+        budget_df = get_session_dataset('2019-01-01', '2019-07-01',
+                                        users_df=users_df, seed=100,
+                                        include_user_columns=['country'],
+                                        max_memory_bytes=max_memory_bytes,
+                                        spill_dir=str(tmp_path))
+        assert_frame_equal(budget_df, expected)
+        plan = budget_df.attrs['memory_plan']
+        assert plan.spill == spill
+        assert plan.estimated_bytes <= max_memory_bytes
+        assert budget_df.attrs['peak_rss_bytes'] > 0
+    # spilled files are removed once mapped
+    assert not list(tmp_path.iterdir())
+
+    with pytest.raises(MemoryError):
+        get_session_dataset('2019-01-01', '2019-07-01', users_df=users_df,
+                            seed=100, max_memory_bytes=2 ** 10)
+    # UUID session IDs can't be spilled
+    with pytest.raises(MemoryError, match='integer keys'):
+        get_session_dataset('2019-01-01', '2019-07-01',
+                            users_df=get_user_dataset('2019-01-01',
+                                                      '2019-07-01', seed=100),
+                            seed=100, max_memory_bytes=2 ** 22)
+
+
+def test_memory_budget_keeps_process_peak_rss():
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    # a peak above the RSS of the budget call
+    peak = np.ones(2 ** 28, dtype=np.uint8)
+    del peak
+    peak_rss_bytes = get_peak_rss_bytes()
+    get_session_dataset('2019-01-01', '2019-02-01', users_df=users_df,
+                        seed=100, max_memory_bytes=2 ** 34)
+    assert get_peak_rss_bytes() >= peak_rss_bytes
+
+
+def test_activation_date_values():
+    new_users_by_date = pd.Series([np.nan, 2.0, 0.0, 3.0],
+                                  index=pd.date_range('2019-01-01',
+                                                      periods=4))
+    date_values = _get_activation_date_values(new_users_by_date,
+                                              start_users=1000, seed=100)
+    assert date_values.dtype == 'datetime64[D]'
+    legacy_dates, new_dates = date_values[:1000], date_values[1000:]
+    assert ((legacy_dates >= np.datetime64('2018-01-01'))
+            & (legacy_dates < np.datetime64('2019-01-01'))).all()
+    assert len(np.unique(legacy_dates)) > 300
+    np.testing.assert_array_equal(
+        new_dates, np.array(['2019-01-02'] * 2 + ['2019-01-04'] * 3,
+                            dtype='datetime64[D]'))
+
+
+def test_age_values_numpy_matches_scipy():
+    pytest.importorskip('scipy')
+    np.testing.assert_array_equal(
+        _get_age_dist_values(10000, seed=100),
+        _get_age_dist_values(10000, seed=100, backend='scipy'))
+    np.testing.assert_array_equal(
+        _get_age_dist_values(10000, rng=np.random.default_rng(100)),
+        _get_age_dist_values(10000, rng=np.random.default_rng(100),
+                             backend='scipy'))
+    with pytest.raises(ValueError):
+        _get_age_dist_values(10, seed=100, backend='torch')
+
+
+def test_user_country_values_match_choice():
+    countries = _get_user_country_values(10000, seed=100)
+    assert list(countries.categories) == ['CA', 'US']
+    assert countries.codes.dtype == np.int8
+    # same draws as choice with the weights
+    np.testing.assert_array_equal(
+        countries.codes,
+        np.random.RandomState(100).choice([0, 1], p=[0.2, 0.8], size=10000))
+
+    country_weights = {'C{:03d}'.format(i): i + 1 for i in range(200)}
+    countries = _get_user_country_values(100000,
+                                         rng=np.random.default_rng(100),
+                                         country_weights=country_weights)
+    assert len(countries.categories) == 200
+    shares = pd.Series(countries).value_counts(normalize=True)
+    expected_shares = pd.Series(country_weights) / sum(country_weights.values())
+    np.testing.assert_allclose(shares[expected_shares.index], expected_shares,
+                               atol=0.002)
+    with pytest.raises(ValueError):
+        _get_user_country_values(10, seed=100, country_weights={'US': -1})
+
+
+@pytest.mark.parametrize('id_format', ['uuid', 'int'])
+def test_user_batches_match_user_dataset(id_format):
+    users_df = (get_user_dataset('2019-01-01', '2019-04-01', seed=100,
+                                 id_format=id_format)
+                .sort_values('activation_date', kind='stable'))
+    for chunk_size in [1000, 3333, 10 ** 6]:
+        batches = list(iter_user_batches('2019-01-01', '2019-04-01',
+                                         seed=100, id_format=id_format,
+                                         chunk_size=chunk_size))
+        assert max(len(batch) for batch in batches) <= chunk_size
+        assert_frame_equal(pd.concat(batches), users_df)
+
+    # drawn from rng, the users and the rng state after are the same too
+    rng = np.random.default_rng(100)
+    users_df = (get_user_dataset('2019-01-01', '2019-04-01', rng=rng,
+                                 id_format=id_format)
+                .sort_values('activation_date', kind='stable'))
+    batch_rng = np.random.default_rng(100)
+    assert_frame_equal(pd.concat(iter_user_batches('2019-01-01', '2019-04-01',
+                                                   rng=batch_rng,
+                                                   id_format=id_format,
+                                                   chunk_size=1000)),
+                       users_df)
+    assert batch_rng.random() == rng.random()
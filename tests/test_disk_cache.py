@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+import src._disk_cache
+from src._disk_cache import (enable_disk_cache, disable_disk_cache,
+                             list_disk_cache, clean_disk_cache,
+                             verify_disk_cache)
+from src.data import get_user_dataset, get_session_dataset
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    enable_disk_cache(str(tmp_path))
+    yield str(tmp_path)
+    disable_disk_cache()
+
+
+def test_disk_cache_reloads_datasets(cache_dir):
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                     users_df=users_df, seed=100)
+    assert len(list_disk_cache(cache_dir)) == 2
+
+    # unseeded calls are not cached
+    get_user_dataset('2019-01-01', '2019-02-01')
+    assert len(list_disk_cache(cache_dir)) == 2
+
+    assert_frame_equal(get_user_dataset('2019-01-01', '2019-02-01',
+                                        seed=100),
+                       users_df)
+    assert_frame_equal(get_session_dataset('2019-01-01', '2019-02-01',
+                                           users_df=users_df, seed=100,
+                                           n_jobs=2),
+                       session_df)
+    assert len(list_disk_cache(cache_dir)) == 2
+
+
+def test_disk_cache_verify_and_clean(cache_dir):
+    get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    get_user_dataset('2019-01-01', '2019-02-01', seed=200)
+    assert verify_disk_cache(cache_dir) == {}
+
+    key = list_disk_cache(cache_dir)[0].key
+    with open(os.path.join(cache_dir, key, '0.npy'), 'ab') as f:
+        f.write(b'corrupt')
+    assert list(verify_disk_cache(cache_dir, remove=True)) == [key]
+    assert len(list_disk_cache(cache_dir)) == 1
+
+    assert len(clean_disk_cache(0, cache_dir=cache_dir)) == 1
+    assert list_disk_cache(cache_dir) == []
+
+
+def test_disk_cache_bypassed_with_memory_budget(cache_dir):
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    kwargs = dict(users_df=users_df, seed=100,
+                  include_user_columns=['country'])
+    for _ in range(2):
+        budget_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                        max_memory_bytes=2 ** 30, **kwargs)
+        assert set(budget_df.attrs) == {'peak_rss_bytes', 'memory_plan'}
+    assert len(list_disk_cache(cache_dir)) == 1  # users_df only
+
+    session_df = get_session_dataset('2019-01-01', '2019-02-01', **kwargs)
+    assert session_df.attrs == {}
+    assert len(list_disk_cache(cache_dir)) == 2
+    # and a budget call after it doesn't reload the cached sessions
+    budget_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                    max_memory_bytes=2 ** 30, **kwargs)
+    assert 'memory_plan' in budget_df.attrs
+
+
+def test_disk_cache_hits_are_writable(cache_dir):
+    get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    users_df['age'] += 1
+    users_df.iloc[0, users_df.columns.get_loc('age')] = 99
+    assert users_df['age'].iloc[0] == 99
+
+    # memory maps on request, read-only
+    enable_disk_cache(cache_dir, mmap=True)
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    assert isinstance(np.asarray(users_df['age']).base, np.memmap)
+    with pytest.raises(ValueError):
+        users_df['age'].values[0] = 99
+
+
+def test_disk_cache_version_in_key(cache_dir, monkeypatch):
+    get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    monkeypatch.setattr(src._disk_cache, '_VERSION', '0.0.0+cache0')
+    get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    assert len(list_disk_cache(cache_dir)) == 2
+    # entries of other versions are cleaned up
+    clean_disk_cache(2 ** 40, cache_dir=cache_dir)
+    assert ([entry.version for entry in list_disk_cache(cache_dir)]
+            == ['0.0.0+cache0'])
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_MODULES = 'src.data, src.writers, src.simulation'
+
+# cold import time of the src modules themselves (with numpy and pandas
+# already imported), in microseconds
+IMPORT_TIME_BUDGET_US = 50_000
+# heavy or optional modules, which should only be imported on first use
+LAZY_MODULES = ('scipy', 'numba', 'argparse', 'concurrent.futures',
+                'multiprocessing')
+
+
+def _get_import_times(code):
+    """Return list of (name, level, cumulative microseconds) of the modules
+    imported by `python -X importtime -c code`, in a fresh process."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    import_times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # nested imports are indented by two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        import_times.append((name.strip(), level, int(cumulative)))
+    return import_times
+
+
+def test_import_does_not_load_lazy_modules():
+    imported = [name for name, _, _
+                in _get_import_times('import {}'.format(SRC_MODULES))]
+    for module in LAZY_MODULES:
+        assert not [name for name in imported
+                    if name == module or name.startswith(module + '.')], \
+            '{} is imported by {}'.format(module, SRC_MODULES)
+
+
+def test_import_time_budget():
+    # best of 3 runs, to not fail on a noisy run
+    src_import_times = []
+    for _ in range(3):
+        src_import_times.append(sum(
+            cumulative for name, level, cumulative
+            in _get_import_times('import numpy, pandas; import {}'
+                                 .format(SRC_MODULES))
+            if level == 0 and name.split('.')[0] == 'src'))
+    assert min(src_import_times) < IMPORT_TIME_BUDGET_US
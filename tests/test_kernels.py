@@ -0,0 +1,86 @@
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import pandas as pd
+from pandas.testing import assert_frame_equal, assert_series_equal
+
+import src.data
+from src._user_growth import get_active_user_counts_by_date
+from src.data import get_user_dataset, get_session_dataset, iter_session_batches
+
+
+def test_numba_engine_sessions():
+    pytest.importorskip('numba')
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100,
+                                id_format='int')
+    session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                     users_df=users_df, seed=100,
+                                     engine='numba')
+    dau_count = get_active_user_counts_by_date('2019-01-01', '2019-02-01',
+                                               seed=100)
+    sessions_by_date = session_df.groupby('session_start_date')['user_key']
+    assert_series_equal(sessions_by_date.size(), dau_count,
+                        check_names=False, check_freq=False)
+    assert_series_equal(sessions_by_date.nunique(), sessions_by_date.size())
+
+    # users activated on a date are active on it
+    activation_df = session_df.join(users_df['activation_date'],
+                                    on='user_key')
+    assert (activation_df['activation_date']
+            <= activation_df['session_start_date']).all()
+    new_users = users_df[users_df['activation_date'] >= '2019-01-01']
+    assert new_users.index.isin(session_df['user_key']).all()
+
+    assert_frame_equal(
+        pd.concat(iter_session_batches('2019-01-01', '2019-02-01',
+                                       users_df=users_df, seed=100,
+                                       engine='numba', freq='W')),
+        session_df, check_index_type=False)
+
+
+def test_numba_engine_falls_back_to_numpy(monkeypatch):
+    monkeypatch.setattr(src.data, 'get_sample_user_positions_kernel',
+                        lambda: None)
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    with pytest.warns(UserWarning, match='numba'):
+        session_df = get_session_dataset('2019-01-01', '2019-02-01',
+                                         users_df=users_df, seed=100,
+                                         engine='numba')
+    assert_frame_equal(session_df,
+                       get_session_dataset('2019-01-01', '2019-02-01',
+                                           users_df=users_df, seed=100))
+
+
+def test_numba_engine_then_process_pool_exits():
+    pytest.importorskip('numba')
+    # the pool must not fork the threads the kernel started, or the
+    # interpreter hangs at exit
+    code = """if True:
+        from src.data import get_user_dataset, get_session_dataset
+        users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100,
+                                    id_format='int')
+        get_session_dataset('2019-01-01', '2019-02-01', users_df=users_df,
+                            seed=100, engine='numba')
+        get_session_dataset('2019-01-01', '2019-02-01', users_df=users_df,
+                            seed=100, n_jobs=2)
+    """
+    result = subprocess.run([sys.executable, '-c', code],
+                            cwd=Path(__file__).resolve().parents[1],
+                            capture_output=True, timeout=120)
+    assert result.returncode == 0, result.stderr.decode()
+
+
+def test_numba_engine_rejects_executor():
+    pytest.importorskip('numba')
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    with pytest.raises(ValueError, match='numba'):
+        get_session_dataset('2019-01-01', '2019-02-01', users_df=users_df,
+                            seed=100, engine='numba', n_jobs=2)
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError, match='numba'):
+            get_session_dataset('2019-01-01', '2019-02-01',
+                                users_df=users_df, seed=100, engine='numba',
+                                executor=executor)
@@ -0,0 +1,40 @@
+import pytest
+import numpy as np
+
+from src._sampling import sample_without_replacement
+
+
+def _inclusion_freqs(weights, n_draws, *, sampler, n_reps, rng):
+    counts = np.zeros(len(weights))
+    for _ in range(n_reps):
+        drawn = sample_without_replacement(weights, n_draws, sampler=sampler,
+                                           rng=rng)
+        counts[drawn] += 1
+    return counts / n_reps
+
+
+def test_samplers_draw_unique_positions():
+    rng = np.random.default_rng(100)
+    weights = rng.uniform(1, 50, size=1000)
+    for sampler in ['choice', 'exponential']:
+        drawn = sample_without_replacement(weights, 250, sampler=sampler,
+                                           rng=rng)
+        assert len(drawn) == 250
+        assert len(np.unique(drawn)) == 250
+
+
+def test_exponential_sampler_matches_choice_sampler():
+    # inclusion probabilities of each item should agree between backends
+    rng = np.random.default_rng(100)
+    weights = np.array([1, 2, 4, 8, 16, 32], dtype=float)
+    freqs_choice = _inclusion_freqs(weights, 3, sampler='choice',
+                                    n_reps=20000, rng=rng)
+    freqs_exponential = _inclusion_freqs(weights, 3, sampler='exponential',
+                                         n_reps=20000, rng=rng)
+    # std error of each freq is < 0.004, so allow ~5 std errors
+    assert np.abs(freqs_choice - freqs_exponential).max() < 0.02
+
+
+def test_sampler_rejects_oversized_sample():
+    with pytest.raises(ValueError):
+        sample_without_replacement(np.ones(5), 6, sampler='exponential')
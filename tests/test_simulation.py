@@ -0,0 +1,46 @@
+import numpy as np
+from pandas.testing import assert_series_equal, assert_frame_equal
+
+from src._user_growth import get_active_user_counts_by_date
+from src.data import get_user_dataset
+from src.simulation import Simulation
+
+
+def test_simulation_matches_seeded_functions():
+    sim = Simulation('2019-01-01', '2019-02-01', seed=100)
+    assert_series_equal(sim.dau,
+                        get_active_user_counts_by_date('2019-01-01',
+                                                       '2019-02-01',
+                                                       seed=100))
+    users_df = get_user_dataset('2019-01-01', '2019-02-01', seed=100)
+    assert_frame_equal(sim.users, users_df)
+
+
+def test_simulation_rng_sessions_match_dau():
+    sim = Simulation('2019-01-01', '2019-02-01',
+                     rng=np.random.Generator(np.random.SFC64(100)))
+    # trajectories are computed once and cached
+    assert sim.dau is sim.dau
+    sessions_by_date = sim.sessions.groupby('session_start_date').size()
+    assert_series_equal(sessions_by_date, sim.dau,
+                        check_names=False, check_freq=False)
+    assert sim.sessions['user_id'].isin(sim.users.index).all()
+
+
+def test_simulation_rng_independent_of_access_order():
+    sim_1 = Simulation('2019-01-01', '2019-02-01',
+                       rng=np.random.default_rng(100))
+    sim_2 = Simulation('2019-01-01', '2019-02-01',
+                       rng=np.random.default_rng(100))
+    users_1 = sim_1.users
+    dau_2 = sim_2.dau
+    assert_series_equal(sim_1.dau, dau_2)
+    assert_frame_equal(users_1, sim_2.users)
+
+
+def test_simulation_sessions_within_memory_budget():
+    sim = Simulation('2019-01-01', '2019-02-01', seed=100)
+    budget_sim = Simulation('2019-01-01', '2019-02-01', seed=100,
+                            session_options={'max_memory_bytes': 2 ** 30})
+    assert_frame_equal(budget_sim.sessions, sim.sessions)
+    assert 'memory_plan' in budget_sim.sessions.attrs
@@ -3,7 +3,9 @@ import numpy as np
 import pandas.api.types as ptypes
 from pandas.testing import assert_series_equal
 
-from src._user_growth import get_active_user_counts_by_date, get_user_counts_by_date
+from src._user_growth import (get_active_user_counts_by_date, get_user_counts_by_date,
+                              get_active_user_count_paths, get_user_count_paths,
+                              sweep_active_user_counts, _get_counter_keys)
 
 
 def test_active_user_count_values_integer():
@@ -55,3 +57,114 @@ def test_user_count_growth_rate():
                                              start_users=start_users,
                                              seed=100)
         assert np.round(user_count.max() / start_users, decimals=1) == g
+
+
+def test_user_count_rng():
+    # check generators in the same state give same vals
+    for bit_generator in [np.random.PCG64, np.random.SFC64]:
+        user_count_1 = get_user_counts_by_date(
+            '2019-01-01', '2020-01-01',
+            rng=np.random.Generator(bit_generator(100)))
+        user_count_2 = get_user_counts_by_date(
+            '2019-01-01', '2020-01-01',
+            rng=np.random.Generator(bit_generator(100)))
+        assert_series_equal(user_count_1, user_count_2)
+
+    # check seed 0 is used (not treated as unseeded)
+    user_count_1 = get_user_counts_by_date('2019-01-01', '2020-01-01',
+                                           seed=0)
+    user_count_2 = get_user_counts_by_date('2019-01-01', '2020-01-01',
+                                           seed=0)
+    assert_series_equal(user_count_1, user_count_2)
+
+
+def test_user_count_seed_leaves_global_state():
+    np.random.seed(1)
+    expected = np.random.normal()
+    np.random.seed(1)
+    get_user_counts_by_date('2019-01-01', '2020-01-01', seed=100)
+    assert np.random.normal() == expected
+
+
+def test_user_count_paths():
+    user_counts = get_user_count_paths('2019-01-01', '2020-01-01',
+                                       n_paths=500, seed=100)
+    assert user_counts.shape == (500, 365)
+    assert ptypes.is_integer_dtype(user_counts)
+    # first path is the single trajectory for the seed
+    np.testing.assert_array_equal(
+        user_counts[0],
+        get_user_counts_by_date('2019-01-01', '2020-01-01', seed=100))
+    # year-end distribution is centred on approx_yoy_growth_rate
+    assert np.round(np.median(user_counts[:, -1]) / 10000, decimals=1) == 3
+
+
+def test_active_user_count_paths():
+    dau_counts = get_active_user_count_paths('2019-01-01', '2020-01-01',
+                                             n_paths=500, seed=100,
+                                             as_frame=True)
+    assert dau_counts.shape == (500, 365)
+    assert ptypes.is_integer_dtype(dau_counts.values)
+    dau_count = get_active_user_counts_by_date('2019-01-01', '2020-01-01',
+                                               seed=100)
+    assert (dau_counts.columns == dau_count.index).all()
+    # the first path is the single trajectory for a seed (and for an rng,
+    # which draws the user counts first, with one path)
+    np.testing.assert_array_equal(dau_counts.values[0], dau_count.values)
+    dau_counts = get_active_user_count_paths(
+        '2019-01-01', '2020-01-01', n_paths=1,
+        rng=np.random.default_rng(100))
+    dau_count = get_active_user_counts_by_date(
+        '2019-01-01', '2020-01-01', rng=np.random.default_rng(100))
+    np.testing.assert_array_equal(dau_counts[0], dau_count.values)
+
+
+def test_sweep_matches_active_user_counts():
+    growth_rates = [1.5, 2, 3]
+    start_users = [1000, 10000]
+    seeds = [0, 100, 200]
+    sweep = sweep_active_user_counts('2019-01-01', '2020-01-01',
+                                     approx_yoy_growth_rates=growth_rates,
+                                     start_users=start_users, seeds=seeds)
+    assert sweep.values.shape == (3, 2, 3, 365)
+    for i, g in enumerate(growth_rates):
+        for j, n in enumerate(start_users):
+            for k, s in enumerate(seeds):
+                dau_count = get_active_user_counts_by_date(
+                    '2019-01-01', '2020-01-01', approx_yoy_growth_rate=g,
+                    start_users=n, seed=s)
+                np.testing.assert_array_equal(sweep.values[i, j, k],
+                                              dau_count)
+
+    sweep_df = sweep_active_user_counts('2019-01-01', '2020-01-01',
+                                        approx_yoy_growth_rates=growth_rates,
+                                        start_users=start_users, seeds=seeds,
+                                        dates=['2019-12-31'], as_frame=True)
+    assert len(sweep_df) == 3 * 2 * 3
+    np.testing.assert_array_equal(sweep_df['dau_count'],
+                                  sweep.values[..., -1].ravel())
+
+
+def test_counter_based_window_matches_full_simulation():
+    full = get_active_user_counts_by_date('2019-01-01', '2024-01-01',
+                                          seed=100, counter_based=True)
+    for start, end in [('2019-01-01', '2019-02-01'),
+                       ('2021-03-01', '2021-04-01'),
+                       ('2023-12-31', '2024-01-01')]:
+        window = get_active_user_counts_by_date(start, end, seed=100,
+                                                counter_based=True,
+                                                origin_date='2019-01-01')
+        in_window = (full.index >= start) & (full.index < end)
+        assert_series_equal(window, full[in_window], check_freq=False)
+    assert ptypes.is_integer_dtype(full)
+
+    with pytest.raises(ValueError):
+        get_user_counts_by_date('2019-01-01', '2019-02-01', seed=100,
+                                counter_based=True, origin_date='2019-06-01')
+
+
+def test_counter_based_streams_have_disjoint_keys():
+    active_user_p_keys = _get_counter_keys('active_user_p', seed=100,
+                                           n_keys=3)
+    user_count_keys = _get_counter_keys('user_counts', seed=100, n_keys=2)
+    assert not set(active_user_p_keys) & set(user_count_keys)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pytest
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.data import get_user_dataset, get_session_dataset
+from src.writers import (write_session_dataset, write_user_dataset,
+                         write_dataset_batches)
+
+
+@pytest.fixture(scope='module')
+def users_df():
+    return get_user_dataset('2019-01-01', '2019-03-01', seed=100)
+
+
+def test_write_session_dataset_csv(tmp_path, users_df):
+    paths = write_session_dataset(str(tmp_path), '2019-01-01', '2019-03-01',
+                                  users_df=users_df, seed=100,
+                                  file_format='csv.gz', partition_freq='M')
+    assert paths == [os.path.join(str(tmp_path), 'year=2019', 'month=1',
+                                  'part-0.csv.gz'),
+                     os.path.join(str(tmp_path), 'year=2019', 'month=2',
+                                  'part-0.csv.gz')]
+
+    session_df = get_session_dataset('2019-01-01', '2019-03-01',
+                                     users_df=users_df, seed=100)
+    written_df = (pd.concat([pd.read_csv(path,
+                                         parse_dates=['session_start_date'])
+                             for path in paths])
+                  .set_index('session_id'))
+    assert_frame_equal(written_df, session_df)
+
+
+def test_write_user_dataset_parquet(tmp_path, users_df):
+    pytest.importorskip('pyarrow')
+    paths = write_user_dataset(str(tmp_path), '2019-01-01', '2019-03-01',
+                               seed=100, file_format='parquet',
+                               partition_freq='Y')
+    assert len(paths) == 2  # legacy users (2018) and new users (2019)
+    written_df = (pd.read_parquet(str(tmp_path))
+                  .drop(columns=['year'])
+                  .set_index('user_id'))
+    assert_frame_equal(written_df.sort_index(), users_df.sort_index(),
+                       check_like=True)
+
+
+def test_write_user_dataset_chunked_same_files(tmp_path):
+    paths = write_user_dataset(str(tmp_path / 'all'), '2019-01-01',
+                               '2019-03-01', seed=100, file_format='csv')
+    chunked_paths = write_user_dataset(str(tmp_path / 'chunked'),
+                                       '2019-01-01', '2019-03-01', seed=100,
+                                       file_format='csv', chunk_size=1000)
+    assert ([os.path.relpath(path, str(tmp_path / 'all')) for path in paths]
+            == [os.path.relpath(path, str(tmp_path / 'chunked'))
+                for path in chunked_paths])
+    for path, chunked_path in zip(paths, chunked_paths):
+        with open(path) as f, open(chunked_path) as chunked_f:
+            assert f.read() == chunked_f.read()
+
+
+def test_write_user_dataset_modes(tmp_path):
+    kwargs = dict(seed=100, file_format='csv', partition_freq='Y')
+    paths = write_user_dataset(str(tmp_path), '2019-01-01', '2019-03-01',
+                               **kwargs)
+    with pytest.raises(FileExistsError):
+        write_user_dataset(str(tmp_path), '2019-01-01', '2019-03-01',
+                           **kwargs)
+
+    assert write_user_dataset(str(tmp_path), '2019-01-01', '2019-03-01',
+                              mode='overwrite', **kwargs) == paths
+    assert sorted(os.listdir(os.path.dirname(paths[0]))) == ['part-0.csv']
+
+    appended_paths = write_user_dataset(str(tmp_path), '2019-01-01',
+                                        '2019-03-01', mode='append', **kwargs)
+    assert [os.path.basename(path) for path in appended_paths] == \
+        ['part-1.csv', 'part-1.csv']
+
+
+def test_parquet_row_groups_are_full(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    batches = [{'date': np.full(300, np.datetime64('2019-01-01', 'ns')),
+                'value': np.arange(300)} for _ in range(10)]
+    paths = write_dataset_batches(batches, str(tmp_path), partition_col='date',
+                                  file_format='parquet', row_group_size=1000)
+    metadata = pyarrow.parquet.ParquetFile(paths[0]).metadata
+    assert ([metadata.row_group(i).num_rows
+             for i in range(metadata.num_row_groups)] == [1000, 1000, 1000])